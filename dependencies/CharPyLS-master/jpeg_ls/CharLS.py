@@ -11,10 +11,7 @@ def read(fname):
     """
     Read image data from JPEG-LS file.
     """
-    with open(fname, 'rb') as fo:
-        string_buffer = fo.read()
-
-    data_buffer = np.fromstring(string_buffer, dtype=np.uint8)
+    data_buffer = np.fromfile(fname, dtype=np.uint8)
 
     data_image = _CharLS.decode(data_buffer)
 
@@ -59,6 +56,54 @@ def decode(data_buffer):
 
     return data_image
 
+
+
+def decode_into(data_buffer, data_image):
+    """
+    Decode a JPEG-LS buffer (bytes, memoryview, mmap slice, ...) in place into a
+    preallocated uint8/uint16 array, e.g. one slot of a reusable batch array.
+    """
+
+    data_image = _CharLS.decode_into(data_buffer, data_image)
+
+    return data_image
+
+
+
+def read_headers(data_buffers, num_threads=0):
+    """
+    Read JPEG-LS headers of many buffers without decoding the image data.
+    Returns a structured array (width, height, bitspersample, components, error).
+    """
+
+    headers = _CharLS.read_headers(data_buffers, num_threads)
+
+    return headers
+
+
+
+def decode_many(data_buffers, num_threads=0):
+    """
+    Decode a sequence of JPEG-LS buffers into one stacked (N, H, W) image array.
+    Decoding runs in parallel without holding the GIL.
+    """
+
+    data_images = _CharLS.decode_many(data_buffers, num_threads)
+
+    return data_images
+
+
+
+def encode_many(data_images, bits=None, num_threads=0):
+    """
+    Encode a stack or list of grey-scale images in parallel.
+    Returns the concatenated payloads and an (N + 1,) offset table.
+    """
+
+    data_buffer, offsets = _CharLS.encode_many(data_images, bits, num_threads)
+
+    return data_buffer, offsets
+
 #################################################
 
 
@@ -4,6 +4,10 @@
 import numpy as np
 cimport numpy as np
 
+from cython.parallel cimport prange
+from libc.stdlib cimport malloc, free
+from libc.string cimport memcpy
+
 JLS_ERROR_MESSAGES = {0: 'OK',
                       1: 'Invalid Jls Parameters',
                       2: 'Parameter Value Not Supported',
@@ -59,7 +63,7 @@ cdef extern from 'publictypes.h':
         JlsCustomParameters custom
         JfifParameters jfif
 
-cdef extern from 'interface.h':
+cdef extern from 'interface.h' nogil:
     cdef JLS_ERROR JpegLsEncode(char* compressedData, size_t compressedLength, size_t* byteCountWritten,
                                 char* uncompressedData, size_t uncompressedLength, JlsParameters* info)
 
@@ -280,3 +284,396 @@ def decode(np.ndarray[np.uint8_t, ndim=1] data_buffer):
 
     # Done.
     return data_image
+
+
+
+
+def decode_into(data_buffer, data_image):
+    """
+    Decode compressed data into a preallocated image array.
+
+    `data_buffer` may be any object exposing the buffer protocol (bytes,
+    memoryview, mmap slice, uint8 array); it is read in place, not copied.
+    `data_image` must be a writeable C-contiguous uint8 or uint16 array (or a
+    contiguous slice of a larger batch array) holding exactly width x height
+    x components samples.  The GIL is released while decoding.
+    """
+
+    cdef const unsigned char[::1] data_view = data_buffer
+    cdef size_t size_buffer = data_view.shape[0]
+
+    if size_buffer == 0:
+        raise Exception('Empty data buffer')
+
+    # Read the header.
+    cdef JlsParameters info = build_parameters()
+    cdef char* data_buffer_ptr = <char*>&data_view[0]
+    cdef JLS_ERROR err
+
+    with nogil:
+        err = JpegLsReadHeader(data_buffer_ptr, size_buffer, &info)
+
+    if err != 0:
+        raise Exception('Error calling CharLS: {}'.format(JLS_ERROR_MESSAGES[err]))
+
+    # Check output array against header.
+    if 2 <= info.bitspersample <= 8:
+        dtype = np.uint8
+    elif 9 <= info.bitspersample <= 16:
+        dtype = np.uint16
+    else:
+        raise Exception('Invalid bitspersample: {}'.format(info.bitspersample))
+
+    if not isinstance(data_image, np.ndarray):
+        raise Exception('Output must be a numpy array, got {}'.format(type(data_image)))
+
+    if data_image.dtype != dtype:
+        raise Exception('Invalid output data type {}, expecting {} for {} bits per sample.'.format(
+            data_image.dtype, np.dtype(dtype), info.bitspersample))
+
+    if not data_image.flags['C_CONTIGUOUS'] or not data_image.flags['WRITEABLE']:
+        raise Exception('Output array must be writeable and C-contiguous')
+
+    if data_image.size != info.width * info.height * info.components:
+        raise Exception('Invalid output size {}, expecting {}x{}x{}'.format(
+            data_image.shape, info.height, info.width, info.components))
+
+    cdef size_t size_data = data_image.nbytes
+    cdef char* data_image_ptr = <char*>np.PyArray_DATA(<np.ndarray>data_image)
+
+    # Decode compressed data.
+    with nogil:
+        err = JpegLsDecode(data_image_ptr, size_data,
+                           data_buffer_ptr, size_buffer, &info)
+
+    if err != 0:
+        raise Exception('Error calling CharLS: {}'.format(JLS_ERROR_MESSAGES[err]))
+
+    # Done.
+    return data_image
+
+
+
+def _as_buffer_array(data_buffer):
+    """
+    View encoded data (bytes, bytearray, uint8 array) as a contiguous uint8 array.
+    """
+
+    if isinstance(data_buffer, np.ndarray):
+        return np.ascontiguousarray(data_buffer, dtype=np.uint8).reshape(-1)
+
+    return np.frombuffer(data_buffer, dtype=np.uint8)
+
+
+
+cdef class _BufferBatch:
+    """
+    Raw pointers, sizes and headers of a batch of compressed buffers.
+    """
+
+    cdef list buffers
+    cdef Py_ssize_t size
+    cdef char** ptrs
+    cdef size_t* sizes
+    cdef JlsParameters* infos
+    cdef JLS_ERROR* errs
+
+    def __cinit__(self, data_buffers):
+        # Keep references to the contiguous buffers alive while decoding.
+        self.buffers = [_as_buffer_array(b) for b in data_buffers]
+        self.size = len(self.buffers)
+
+        cdef Py_ssize_t num_alloc = max(self.size, 1)
+        self.ptrs = <char**>malloc(num_alloc * sizeof(char*))
+        self.sizes = <size_t*>malloc(num_alloc * sizeof(size_t))
+        self.infos = <JlsParameters*>malloc(num_alloc * sizeof(JlsParameters))
+        self.errs = <JLS_ERROR*>malloc(num_alloc * sizeof(JLS_ERROR))
+
+        if self.ptrs == NULL or self.sizes == NULL or self.infos == NULL or self.errs == NULL:
+            raise MemoryError()
+
+        cdef Py_ssize_t i
+        for i in range(self.size):
+            self.ptrs[i] = <char*>np.PyArray_DATA(self.buffers[i])
+            self.sizes[i] = self.buffers[i].shape[0]
+            self.infos[i] = build_parameters()
+
+    def __dealloc__(self):
+        free(self.ptrs)
+        free(self.sizes)
+        free(self.infos)
+        free(self.errs)
+
+    cdef void read_headers(self, int num_threads):
+        cdef char** ptrs = self.ptrs
+        cdef size_t* sizes = self.sizes
+        cdef JlsParameters* infos = self.infos
+        cdef JLS_ERROR* errs = self.errs
+        cdef Py_ssize_t i
+
+        for i in prange(self.size, nogil=True, num_threads=num_threads, schedule='static'):
+            errs[i] = JpegLsReadHeader(ptrs[i], sizes[i], &infos[i])
+
+    cdef check_errors(self):
+        cdef Py_ssize_t i
+        for i in range(self.size):
+            if self.errs[i] != 0:
+                raise Exception('Error calling CharLS on buffer {}: {}'.format(i, JLS_ERROR_MESSAGES[self.errs[i]]))
+
+
+
+HEADER_DTYPE = np.dtype([('width', np.int32),
+                         ('height', np.int32),
+                         ('bitspersample', np.int32),
+                         ('components', np.int32),
+                         ('error', np.int32)])
+
+
+
+def read_headers(data_buffers, int num_threads=0):
+    """
+    Read the headers of a sequence of compressed buffers without decoding them.
+
+    Returns a structured array with dtype HEADER_DTYPE, one record per buffer.
+    Buffers whose header cannot be parsed are not raised on; their record has
+    a non-zero `error` code (see JLS_ERROR_MESSAGES) and zeroed fields.
+    """
+
+    batch = _BufferBatch(data_buffers)
+    batch.read_headers(num_threads)
+
+    headers = np.zeros(batch.size, dtype=HEADER_DTYPE)
+
+    cdef Py_ssize_t i
+    for i in range(batch.size):
+        if batch.errs[i] != 0:
+            headers[i] = (0, 0, 0, 0, batch.errs[i])
+        else:
+            headers[i] = (batch.infos[i].width, batch.infos[i].height,
+                          batch.infos[i].bitspersample, batch.infos[i].components, 0)
+
+    # Done.
+    return headers
+
+
+
+def decode_many(data_buffers, int num_threads=0):
+    """
+    Decode a sequence of compressed buffers into one stacked image array.
+
+    All buffers must hold images with identical width, height, bit depth and
+    number of components.  Headers and image data are decoded without holding
+    the GIL, spread over `num_threads` OpenMP threads (0 lets OpenMP decide).
+    Returns an array of shape (N, height, width), or (N, height, width, bands)
+    for multi-component images.
+    """
+
+    batch = _BufferBatch(data_buffers)
+
+    cdef Py_ssize_t num_images = batch.size
+    if num_images == 0:
+        raise Exception('No buffers to decode')
+
+    # Read all headers.
+    batch.read_headers(num_threads)
+    batch.check_errors()
+
+    cdef JlsParameters* infos = batch.infos
+    cdef Py_ssize_t i
+    for i in range(num_images):
+        if (infos[i].width != infos[0].width or infos[i].height != infos[0].height or
+                infos[i].bitspersample != infos[0].bitspersample or
+                infos[i].components != infos[0].components):
+            raise Exception('Buffer {} holds a {}x{}x{} image with {} bits, expected {}x{}x{} with {} bits'.format(
+                i, infos[i].height, infos[i].width, infos[i].components, infos[i].bitspersample,
+                infos[0].height, infos[0].width, infos[0].components, infos[0].bitspersample))
+
+    # Sizes of data.
+    if 2 <= infos[0].bitspersample <= 8:
+        dtype = np.uint8
+    elif 9 <= infos[0].bitspersample <= 16:
+        dtype = np.uint16
+    else:
+        raise Exception('Invalid bitspersample: {}'.format(infos[0].bitspersample))
+
+    if infos[0].components == 1:
+        shape = (num_images, infos[0].height, infos[0].width)
+    else:
+        shape = (num_images, infos[0].height, infos[0].width, infos[0].components)
+
+    data_images = np.empty(shape, dtype=dtype)
+
+    cdef char* data_image_ptr = <char*>np.PyArray_DATA(data_images)
+    cdef size_t size_image = data_images.nbytes // num_images
+    cdef char** buffer_ptrs = batch.ptrs
+    cdef size_t* buffer_sizes = batch.sizes
+    cdef JLS_ERROR* errs = batch.errs
+
+    # Decode compressed data.
+    for i in prange(num_images, nogil=True, num_threads=num_threads, schedule='static'):
+        errs[i] = JpegLsDecode(data_image_ptr + i * size_image, size_image,
+                               buffer_ptrs[i], buffer_sizes[i], &infos[i])
+
+    batch.check_errors()
+
+    # Done.
+    return data_images
+
+
+
+cdef inline int _bits_needed(char* data, size_t num_values, int Bpp) noexcept nogil:
+    """
+    Smallest JPEG-LS bit depth holding the largest sample of an image.
+    """
+    cdef size_t k
+    cdef unsigned int max_val = 0
+    cdef int bits = 0
+
+    if Bpp == 1:
+        for k in range(num_values):
+            if (<unsigned char*>data)[k] > max_val:
+                max_val = (<unsigned char*>data)[k]
+    else:
+        for k in range(num_values):
+            if (<unsigned short*>data)[k] > max_val:
+                max_val = (<unsigned short*>data)[k]
+
+    while max_val > 0:
+        bits += 1
+        max_val >>= 1
+
+    # 16 bit input always keeps 16 bit storage, i.e. at least 9 bits.
+    if Bpp == 2 and bits < 9:
+        bits = 9
+    if bits < 2:
+        bits = 2
+
+    return bits
+
+
+
+def encode_many(data_images, bits=None, int num_threads=0, int chunk_size=1024):
+    """
+    Encode a stack (N, H, W) or a list of grey-scale images in parallel.
+
+    Images are encoded without holding the GIL, `chunk_size` at a time, over
+    `num_threads` OpenMP threads (0 lets OpenMP decide).  The bit depth is
+    taken from each image's maximum (scanned in C), unless `bits` is given:
+    then the scan is skipped and every sample must fit in `bits` bits.  uint8
+    images use 2-8 bits, uint16 images 9-16 bits.
+
+    Returns (data_buffer, offsets): the concatenated payloads as one uint8
+    array and an (N + 1,) uint64 offset table, so that image i is encoded in
+    data_buffer[offsets[i]:offsets[i + 1]].
+    """
+
+    if isinstance(data_images, np.ndarray):
+        if data_images.ndim != 3:
+            raise Exception('Invalid data shape, expecting (N, H, W)')
+        images = list(np.ascontiguousarray(data_images))
+    else:
+        images = [np.ascontiguousarray(d) for d in data_images]
+
+    cdef Py_ssize_t num_images = len(images)
+    cdef int fixed_bits = 0 if bits is None else bits
+    cdef int j, Bpp, num_batch
+    cdef size_t num_values
+
+    for d in images:
+        if d.dtype == np.uint8:
+            Bpp = 1
+        elif d.dtype == np.uint16:
+            Bpp = 2
+        else:
+            raise Exception('Invalid input data type {}, expecting np.uint8 or np.uint16.'.format(d.dtype))
+        if d.ndim != 2:
+            raise Exception('Invalid data shape {}'.format(d.shape))
+        if d.size == 0:
+            raise Exception('Invalid empty image of shape {}'.format(d.shape))
+        if fixed_bits and not (2 <= fixed_bits <= 8 if Bpp == 1 else 9 <= fixed_bits <= 16):
+            raise Exception('Invalid bits {} for input data type {}'.format(fixed_bits, d.dtype))
+
+    cdef int num_chunk = max(1, min(chunk_size, num_images))
+    cdef char** image_ptrs = <char**>malloc(num_chunk * sizeof(char*))
+    cdef size_t* image_sizes = <size_t*>malloc(num_chunk * sizeof(size_t))
+    cdef size_t* scratch_offsets = <size_t*>malloc(num_chunk * sizeof(size_t))
+    cdef size_t* size_work = <size_t*>malloc(num_chunk * sizeof(size_t))
+    cdef JlsParameters* infos = <JlsParameters*>malloc(num_chunk * sizeof(JlsParameters))
+    cdef JLS_ERROR* errs = <JLS_ERROR*>malloc(num_chunk * sizeof(JLS_ERROR))
+
+    cdef size_t size_scratch, size_chunk
+    cdef char* scratch_ptr
+    cdef char* chunk_ptr
+
+    offsets = np.zeros(num_images + 1, dtype=np.uint64)
+    chunks = []
+
+    try:
+        if (image_ptrs == NULL or image_sizes == NULL or scratch_offsets == NULL or
+                size_work == NULL or infos == NULL or errs == NULL):
+            raise MemoryError()
+
+        for start in range(0, num_images, num_chunk):
+            batch = images[start:start + num_chunk]
+            num_batch = len(batch)
+
+            # Setup parameter structures and worst-case output slots.
+            size_scratch = 0
+            for j in range(num_batch):
+                d = batch[j]
+                Bpp = d.itemsize
+                infos[j] = build_parameters()
+                infos[j].width = d.shape[1]
+                infos[j].height = d.shape[0]
+                infos[j].components = 1
+                infos[j].ilv = <interleavemode>0
+                infos[j].bytesperline = d.shape[1] * Bpp
+                infos[j].bitspersample = fixed_bits
+                infos[j].allowedlossyerror = 0
+                image_ptrs[j] = <char*>np.PyArray_DATA(d)
+                image_sizes[j] = d.nbytes
+                scratch_offsets[j] = size_scratch
+                size_scratch += d.nbytes * 2 + 1024
+
+            scratch = np.empty(size_scratch, dtype=np.uint8)
+            scratch_ptr = <char*>np.PyArray_DATA(scratch)
+
+            # Call encoder function.
+            for j in prange(num_batch, nogil=True, num_threads=num_threads, schedule='dynamic'):
+                if infos[j].bitspersample == 0:
+                    num_values = infos[j].width * infos[j].height
+                    infos[j].bitspersample = _bits_needed(image_ptrs[j], num_values, image_sizes[j] // num_values)
+                errs[j] = JpegLsEncode(scratch_ptr + scratch_offsets[j], image_sizes[j] * 2 + 1024, &size_work[j],
+                                       image_ptrs[j], image_sizes[j], &infos[j])
+
+            # Pack the payloads back to back.
+            size_chunk = 0
+            for j in range(num_batch):
+                if errs[j] != 0:
+                    raise Exception('Error calling CharLS on image {}: {}'.format(start + j, JLS_ERROR_MESSAGES[errs[j]]))
+                offsets[start + j + 1] = size_work[j]
+                size_chunk += size_work[j]
+
+            chunk = np.empty(size_chunk, dtype=np.uint8)
+            chunk_ptr = <char*>np.PyArray_DATA(chunk)
+            with nogil:
+                size_chunk = 0
+                for j in range(num_batch):
+                    memcpy(chunk_ptr + size_chunk, scratch_ptr + scratch_offsets[j], size_work[j])
+                    size_chunk += size_work[j]
+            chunks.append(chunk)
+
+    finally:
+        free(image_ptrs)
+        free(image_sizes)
+        free(scratch_offsets)
+        free(size_work)
+        free(infos)
+        free(errs)
+
+    # Finish.
+    offsets = np.cumsum(offsets, dtype=np.uint64)
+    data_buffer = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint8)
+
+    # All done.
+    return data_buffer, offsets
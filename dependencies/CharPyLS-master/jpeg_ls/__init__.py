@@ -1,8 +1,15 @@
 
 from .CharLS import encode
+from .CharLS import encode_many
 from .CharLS import decode
+from .CharLS import decode_into
+from .CharLS import decode_many
+from .CharLS import read_headers
 
 from .CharLS import write
 from .CharLS import read
 
+from .archive import Archive
+from .archive import ArchiveWriter
+
 
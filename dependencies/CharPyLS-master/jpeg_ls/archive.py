@@ -0,0 +1,162 @@
+
+import numpy as np
+
+from . import CharLS
+
+#################################################
+
+INDEX_FIELDS = [('offset', np.uint64),
+                ('length', np.uint64),
+                ('height', np.uint16),
+                ('width', np.uint16),
+                ('components', np.uint8),
+                ('bitspersample', np.uint8)]
+
+
+def data_path(path):
+    return path + '.data'
+
+
+def index_path(path):
+    return path + '.index.npy'
+
+#################################################
+
+
+class ArchiveWriter(object):
+    """
+    Write many JPEG-LS payloads to one packed archive.
+
+    The archive is a data file holding the concatenated payloads and an index
+    (.npy structured array) with one record per payload: event id, offset,
+    length and image shape.  Use as a context manager, or call close() to
+    write the index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fo = open(data_path(path), 'wb')
+        self._offset = 0
+        self._event_ids = []
+        self._records = []
+
+    def add(self, event_id, data):
+        """
+        Append one image.  `data` is either an already encoded JPEG-LS buffer
+        (bytes-like or 1-D uint8 array) or a 2-D uint8/uint16 image to encode.
+        """
+        if isinstance(data, np.ndarray) and data.ndim >= 2:
+            data = CharLS.encode(data)
+
+        header = CharLS.read_headers([data])[0]
+        if header['error'] != 0:
+            raise Exception('Invalid JPEG-LS payload for event {}'.format(event_id))
+
+        payload = memoryview(data).cast('B')
+        self._fo.write(payload)
+
+        if isinstance(event_id, str):
+            event_id = event_id.encode()
+        self._event_ids.append(event_id)
+        self._records.append((self._offset, payload.nbytes,
+                              header['height'], header['width'],
+                              header['components'], header['bitspersample']))
+        self._offset += payload.nbytes
+
+    def add_many(self, event_ids, data_images, bits=None, num_threads=0):
+        """
+        Encode a stack or list of images in parallel (see encode_many) and
+        append them in order.
+        """
+        data_buffer, offsets = CharLS.encode_many(data_images, bits, num_threads)
+
+        for i, event_id in enumerate(event_ids):
+            self.add(event_id, data_buffer[offsets[i]:offsets[i + 1]])
+
+    def close(self):
+        if self._fo.closed:
+            return
+        self._fo.close()
+
+        id_len = max([len(e) for e in self._event_ids] + [1])
+        index = np.zeros(len(self._records), dtype=[('event_id', 'S{}'.format(id_len))] + INDEX_FIELDS)
+        index['event_id'] = self._event_ids
+        for name, column in zip([f[0] for f in INDEX_FIELDS], zip(*self._records)):
+            index[name] = column
+
+        np.save(index_path(self.path), index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+
+class Archive(object):
+    """
+    Read-only, memory-mapped view of an archive written by ArchiveWriter.
+
+    Payloads are sliced straight out of the mapped data file, so single
+    lookups are O(1) and batched decodes never copy the encoded data.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = np.load(index_path(path), mmap_mode='r')
+        if self.index.shape[0] > 0:
+            self._data = np.memmap(data_path(path), dtype=np.uint8, mode='r')
+        else:
+            self._data = np.zeros(0, dtype=np.uint8)
+        self._positions = None
+
+    def __len__(self):
+        return self.index.shape[0]
+
+    @property
+    def event_ids(self):
+        return self.index['event_id']
+
+    def position(self, event_id):
+        """
+        Return the index position of an event id.
+        """
+        if self._positions is None:
+            self._positions = {e: i for i, e in enumerate(self.index['event_id'].tolist())}
+        if isinstance(event_id, str):
+            event_id = event_id.encode()
+        return self._positions[event_id]
+
+    def payload(self, i):
+        """
+        Encoded bytes of record i, as a view into the mapped data file.
+        """
+        offset = int(self.index['offset'][i])
+        return self._data[offset:offset + int(self.index['length'][i])]
+
+    def __getitem__(self, i):
+        return self.decode([i])[0]
+
+    def get(self, event_id):
+        return self[self.position(event_id)]
+
+    def decode(self, indices, out=None, num_threads=0):
+        """
+        Decode the records at `indices` into one stacked (N, H, W) array.
+
+        With `out`, each image is decoded in place into out[k] (e.g. a batch
+        buffer reused across steps); otherwise all records must share one
+        shape and are decoded in parallel with decode_many.
+        """
+        payloads = [self.payload(i) for i in indices]
+
+        if out is None:
+            return CharLS.decode_many(payloads, num_threads)
+
+        for k, payload in enumerate(payloads):
+            CharLS.decode_into(payload, out[k])
+        return out
+
+    def decode_events(self, event_ids, out=None, num_threads=0):
+        return self.decode([self.position(e) for e in event_ids], out=out, num_threads=num_threads)
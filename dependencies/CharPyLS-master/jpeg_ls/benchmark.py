@@ -0,0 +1,199 @@
+
+import argparse
+import glob
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+from . import CharLS
+from . import data_io
+
+#################################################
+
+PATH_REFERENCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test', 'jlsimV100')
+
+
+def synthetic_holograms(num_images, dtype=np.uint8, size=200, seed=0):
+    """
+    Generate hologram-like test images: a smooth background with decaying
+    circular interference fringes around a random particle position, plus
+    sensor noise.  Compresses like real Poleno holograms, unlike white noise.
+    """
+    rng = np.random.RandomState(seed)
+    max_val = np.iinfo(dtype).max if dtype == np.uint8 else 4095
+
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32)
+    data = np.empty((num_images, size, size), dtype=dtype)
+
+    for i in range(num_images):
+        cy, cx = rng.uniform(0.3 * size, 0.7 * size, 2)
+        r2 = (y - cy)**2 + (x - cx)**2
+        fringes = np.cos(r2 / rng.uniform(20., 60.)) * np.exp(-np.sqrt(r2) / rng.uniform(15., 40.))
+        image = 0.7 + 0.25 * fringes + rng.normal(0., 0.01, (size, size))
+        data[i] = np.clip(image * max_val, 0, max_val).astype(dtype)
+
+    return data
+
+
+def reference_images():
+    """
+    Grey-scale source images of the JPEG-LS conformance set, by name.
+    """
+    images = {}
+    for fname in sorted(glob.glob(os.path.join(PATH_REFERENCE, '*.PGM'))):
+        image = data_io.read(fname)
+        if image.dtype != np.uint8:
+            image = image.astype(np.uint16)
+        images[os.path.basename(fname)] = image
+    return images
+
+
+def reference_buffers():
+    """
+    Compressed images of the JPEG-LS conformance set that CharLS decodes, by name.
+    """
+    buffers = {}
+    for fname in sorted(glob.glob(os.path.join(PATH_REFERENCE, '*.JLS'))):
+        data_buffer = np.fromfile(fname, dtype=np.uint8)
+        if CharLS.read_headers([data_buffer])[0]['error'] == 0:
+            try:
+                CharLS.decode(data_buffer)
+            except Exception:
+                continue
+            buffers[os.path.basename(fname)] = data_buffer
+    return buffers
+
+#################################################
+
+
+def _best_time(func, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _result(name, op, mode, threads, num_images, num_bytes, size_comp, seconds):
+    return {'case': name,
+            'op': op,
+            'mode': mode,
+            'threads': threads,
+            'num_images': num_images,
+            'seconds': seconds,
+            'images_per_s': num_images / seconds,
+            'mb_per_s': num_bytes / seconds / 1e6,
+            'compression_ratio': num_bytes / float(size_comp)}
+
+
+def bench_images(name, data_images, threads=(1,), repeat=3):
+    """
+    Encode and decode a list of same-shaped images one at a time (`single`)
+    and through encode_many/decode_many (`batch`) for every thread count.
+    """
+    num_images = len(data_images)
+    num_bytes = sum(d.nbytes for d in data_images)
+
+    buffers = [CharLS.encode(d) for d in data_images]
+    size_comp = sum(b.size for b in buffers)
+
+    results = []
+
+    seconds = _best_time(lambda: [CharLS.encode(d) for d in data_images], repeat)
+    results.append(_result(name, 'encode', 'single', 1, num_images, num_bytes, size_comp, seconds))
+
+    seconds = _best_time(lambda: [CharLS.decode(b) for b in buffers], repeat)
+    results.append(_result(name, 'decode', 'single', 1, num_images, num_bytes, size_comp, seconds))
+
+    for num_threads in threads:
+        seconds = _best_time(lambda: CharLS.encode_many(data_images, num_threads=num_threads), repeat)
+        results.append(_result(name, 'encode', 'batch', num_threads, num_images, num_bytes, size_comp, seconds))
+
+        seconds = _best_time(lambda: CharLS.decode_many(buffers, num_threads=num_threads), repeat)
+        results.append(_result(name, 'decode', 'batch', num_threads, num_images, num_bytes, size_comp, seconds))
+
+    return results
+
+
+def bench_decode(name, data_buffer, num_images, threads=(1,), repeat=3):
+    """
+    Decode one reference buffer `num_images` times, single and batched.
+    """
+    data_image = CharLS.decode(data_buffer)
+    num_bytes = data_image.nbytes * num_images
+    size_comp = data_buffer.size * num_images
+    buffers = [data_buffer] * num_images
+
+    results = []
+
+    seconds = _best_time(lambda: [CharLS.decode(b) for b in buffers], repeat)
+    results.append(_result(name, 'decode', 'single', 1, num_images, num_bytes, size_comp, seconds))
+
+    for num_threads in threads:
+        seconds = _best_time(lambda: CharLS.decode_many(buffers, num_threads=num_threads), repeat)
+        results.append(_result(name, 'decode', 'batch', num_threads, num_images, num_bytes, size_comp, seconds))
+
+    return results
+
+
+def run(num_images=1000, num_reference=20, threads=None, repeat=3):
+    """
+    Run the whole suite and return a JSON-serializable report.
+    """
+    if threads is None:
+        threads = sorted(set([1, 2, 4, os.cpu_count() or 1]))
+
+    results = []
+
+    for dtype in (np.uint8, np.uint16):
+        data_images = list(synthetic_holograms(num_images, dtype=dtype))
+        name = 'hologram_200x200_{}'.format(np.dtype(dtype).name)
+        results.extend(bench_images(name, data_images, threads, repeat))
+
+    for name, data_image in reference_images().items():
+        results.extend(bench_images(name, [data_image] * num_reference, threads, repeat))
+
+    for name, data_buffer in reference_buffers().items():
+        results.extend(bench_decode(name, data_buffer, num_reference, threads, repeat))
+
+    report = {'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'python': platform.python_version(),
+                       'numpy': np.__version__,
+                       'platform': platform.platform(),
+                       'processor': platform.processor(),
+                       'cpu_count': os.cpu_count(),
+                       'num_images': num_images,
+                       'num_reference': num_reference,
+                       'threads': list(threads),
+                       'repeat': repeat},
+              'results': results}
+
+    return report
+
+#################################################
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='CharPyLS encode/decode throughput benchmark.')
+    parser.add_argument('--output', default='charpyls_benchmark.json', help='JSON report file')
+    parser.add_argument('--num-images', type=int, default=1000, help='synthetic holograms per case')
+    parser.add_argument('--num-reference', type=int, default=20, help='copies of each reference image per batch')
+    parser.add_argument('--threads', type=int, nargs='+', default=None, help='thread counts for batched calls')
+    parser.add_argument('--repeat', type=int, default=3, help='timing repeats, best is kept')
+    args = parser.parse_args(argv)
+
+    report = run(args.num_images, args.num_reference, args.threads, args.repeat)
+
+    with open(args.output, 'w') as fo:
+        json.dump(report, fo, indent=2)
+
+    for r in report['results']:
+        print('{case:>24s} {op:>6s} {mode:>6s} x{threads:<3d} {images_per_s:10.1f} img/s {mb_per_s:8.1f} MB/s'.format(**r))
+
+
+if __name__ == '__main__':
+    main()
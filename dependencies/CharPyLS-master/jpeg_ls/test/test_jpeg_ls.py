@@ -2,12 +2,15 @@
 
 
 import os
+import shutil
+import tempfile
 import unittest
 import numpy as np
 from jpeg_ls import data_io
 
 import jpeg_ls as jls
 import jpeg_ls.CharLS
+import jpeg_ls.benchmark
 
 class Test_Jpeg_LS(unittest.TestCase):
 
@@ -124,6 +127,149 @@ class Test_Jpeg_LS(unittest.TestCase):
         self.assertTrue(diff == 0)
 
 
+    def test_read_headers(self):
+        data_comp = [jls.encode(np.random.randint(0, 255, size=(200, 200)).astype(np.uint8)),
+                     jls.encode(np.random.randint(0, 4000, size=(100, 150)).astype(np.uint16)),
+                     b'not a jpeg-ls buffer']
+
+        headers = jls.read_headers(data_comp)
+
+        self.assertTrue(headers.shape == (3,))
+        self.assertTrue(headers['width'].tolist() == [200, 150, 0])
+        self.assertTrue(headers['height'].tolist() == [200, 100, 0])
+        self.assertTrue(headers['bitspersample'][0] == 8)
+        self.assertTrue(headers['bitspersample'][1] == 12)
+        self.assertTrue(headers['components'].tolist() == [1, 1, 0])
+        self.assertTrue(headers['error'][0] == 0 and headers['error'][2] != 0)
+
+
+    def test_decode_many_uint8(self):
+        data = [np.random.randint(0, 255, size=(200, 200)).astype(np.uint8) for _ in range(16)]
+
+        data_comp = [jls.encode(d) for d in data]
+
+        data_images = jls.decode_many(data_comp)
+
+        self.assertTrue(data_images.shape == (16, 200, 200))
+        self.assertTrue(data_images.dtype == np.uint8)
+        self.assertTrue((data_images == np.stack(data)).all())
+
+
+    def test_decode_many_uint16_bytes(self):
+        data = [np.random.randint(0, 4000, size=(200, 200)).astype(np.uint16) for _ in range(4)]
+
+        data_comp = [jls.encode(d).tobytes() for d in data]
+
+        data_images = jls.decode_many(data_comp, num_threads=2)
+
+        self.assertTrue(data_images.dtype == np.uint16)
+        self.assertTrue((data_images == np.stack(data)).all())
+
+
+    def test_decode_into_batch_slice(self):
+        data = np.random.randint(0, 255, size=(200, 200)).astype(np.uint8)
+        data_comp = jls.encode(data)
+
+        batch = np.zeros((3, 200, 200), dtype=np.uint8)
+        jls.decode_into(memoryview(data_comp.tobytes()), batch[1])
+
+        self.assertTrue((batch[1] == data).all())
+        self.assertTrue((batch[0] == 0).all() and (batch[2] == 0).all())
+
+
+    def test_decode_into_invalid_output(self):
+        data_comp = jls.encode(np.zeros((200, 200), dtype=np.uint8))
+
+        self.assertRaises(Exception, jls.decode_into, data_comp, np.zeros((200, 200), dtype=np.uint16))
+        self.assertRaises(Exception, jls.decode_into, data_comp, np.zeros((100, 200), dtype=np.uint8))
+        self.assertRaises(Exception, jls.decode_into, data_comp, np.zeros((200, 400), dtype=np.uint8)[:, ::2])
+
+
+    def test_decode_many_mismatch(self):
+        data_comp = [jls.encode(np.zeros((200, 200), dtype=np.uint8)),
+                     jls.encode(np.zeros((100, 200), dtype=np.uint8))]
+
+        self.assertRaises(Exception, jls.decode_many, data_comp)
+
+
+    def test_encode_many(self):
+        data = np.random.randint(0, 255, size=(8, 200, 200)).astype(np.uint8)
+
+        data_buffer, offsets = jls.encode_many(data)
+
+        self.assertTrue(offsets.shape == (9,))
+        self.assertTrue(offsets[-1] == data_buffer.size)
+        for i in range(8):
+            data_comp = data_buffer[offsets[i]:offsets[i + 1]]
+            self.assertTrue((data_comp == jls.encode(data[i])).all())
+
+        data_images = jls.decode_many([data_buffer[offsets[i]:offsets[i + 1]] for i in range(8)])
+        self.assertTrue((data_images == data).all())
+
+
+    def test_encode_many_fixed_bits(self):
+        data = [np.random.randint(0, 4000, size=(100, 120)).astype(np.uint16) for _ in range(3)]
+
+        data_buffer, offsets = jls.encode_many(data, bits=12)
+
+        headers = jls.read_headers([data_buffer[offsets[i]:offsets[i + 1]] for i in range(3)])
+        self.assertTrue((headers['bitspersample'] == 12).all())
+
+        data_image = jls.decode(data_buffer[offsets[1]:offsets[2]])
+        self.assertTrue((data_image == data[1]).all())
+
+        self.assertRaises(Exception, jls.encode_many, data, bits=8)
+
+    def test_encode_many_empty_image(self):
+        data = [np.zeros((10, 12), dtype=np.uint8), np.zeros((0, 12), dtype=np.uint8)]
+
+        self.assertRaises(Exception, jls.encode_many, data)
+        self.assertRaises(Exception, jls.encode_many, np.zeros((2, 10, 0), dtype=np.uint8))
+
+
+    def test_archive_roundtrip(self):
+        data = [np.random.randint(0, 255, size=(200, 200)).astype(np.uint8) for _ in range(5)]
+        event_ids = ['event-{}'.format(i) for i in range(5)]
+
+        path_temp = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(path_temp, 'holograms')
+            with jls.ArchiveWriter(fname) as writer:
+                for event_id, d in zip(event_ids, data):
+                    if event_id == 'event-0':
+                        writer.add(event_id, jls.encode(d).tobytes())
+                    else:
+                        writer.add(event_id, d)
+
+            archive = jls.Archive(fname)
+
+            self.assertTrue(len(archive) == 5)
+            self.assertTrue((archive.get('event-3') == data[3]).all())
+            self.assertTrue(archive.index['height'].tolist() == [200] * 5)
+
+            data_images = archive.decode([4, 0, 2])
+            self.assertTrue((data_images == np.stack([data[4], data[0], data[2]])).all())
+
+            batch = np.zeros((2, 200, 200), dtype=np.uint8)
+            archive.decode_events(['event-1', 'event-0'], out=batch)
+            self.assertTrue((batch == np.stack([data[1], data[0]])).all())
+
+            del archive
+        finally:
+            shutil.rmtree(path_temp)
+
+
+    def test_benchmark_report(self):
+        data_images = list(jpeg_ls.benchmark.synthetic_holograms(4, dtype=np.uint16))
+
+        results = jpeg_ls.benchmark.bench_images('holo', data_images, threads=(1, 2), repeat=1)
+
+        self.assertTrue(len(results) == 6)
+        for r in results:
+            self.assertTrue(r['images_per_s'] > 0 and r['mb_per_s'] > 0)
+            self.assertTrue(r['compression_ratio'] > 1)
+
+
 # Standalone.
 if __name__ == '__main__':
     unittest.main(verbosity=2)
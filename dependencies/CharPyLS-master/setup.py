@@ -25,15 +25,17 @@ include_dirs = ['jpeg_ls/CharLS_src',
                 np.get_include()]
 
 # Platform-specific arguments
+# OpenMP runs the batched (prange) calls in parallel.  Without it they still
+# release the GIL but run on a single thread (e.g. Apple clang).
 if sys.platform == "win32":
-    extra_compile_args = []  # ['/EHsc']
+    extra_compile_args = ['/openmp']  # ['/EHsc']
     extra_link_args = []
 elif sys.platform == "darwin":
     extra_compile_args = []
     extra_link_args = []
 else:
-    extra_compile_args = []
-    extra_link_args = []
+    extra_compile_args = ['-fopenmp']
+    extra_link_args = ['-fopenmp']
 
 # These next two lines are left over from when I was playing with MinGW64 on my Windows PC.
 # extra_compile_args = ['-m64'] #, '-nostdlib', '-lgcc']
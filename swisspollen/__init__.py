@@ -0,0 +1 @@
+"""Helpers shared by the swisspollen-training notebooks (training, model export and validation)."""
@@ -0,0 +1,98 @@
+"""Content-addressed dataset cache shared by all models."""
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+def dataset_cache_key(**description) -> str:
+    """Return a stable hash of everything that determines a cached dataset's content
+
+    e.g. dataset_cache_key(dataset_map=..., dataset_sizes=..., split=..., model_features=..., data_filters=...).
+    Values must be JSON serializable; dict keys are sorted so that the definition order does not matter.
+    """
+
+    blob = json.dumps(description, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode()).hexdigest()[:16]
+
+
+class DatasetCache:
+    """A directory of cache entries (one sub-directory per key), evicted least recently used first.
+
+    Each entry holds cached data (e.g. the shard of a dataset, see swisspollen/shards.py) plus an `info.json` file
+    with the description the key was computed from and the time the entry was last used.
+    """
+
+    INFO_FILE = 'info.json'
+
+    def __init__(self, root: str, max_bytes: Optional[int] = None):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def path(self, key: str, name: str, description: Optional[dict] = None) -> str:
+        """Return the path prefix to give to `enable_cache` for file `name` of entry `key`, and mark
+        the entry as used."""
+
+        os.makedirs(self.entry_path(key), exist_ok=True)
+        self.touch(key, description)
+        return os.path.join(self.entry_path(key), name)
+
+    def exists(self, key: str, name: str) -> bool:
+        """Whether the tf.data cache files of `name` have been fully written."""
+        return os.path.isfile(os.path.join(self.entry_path(key), f'{name}.index'))
+
+    def touch(self, key: str, description: Optional[dict] = None):
+        os.makedirs(self.entry_path(key), exist_ok=True)
+        info = self.info(key)
+        info['last_used'] = time.time()
+        if description is not None:
+            info['description'] = description
+        with open(os.path.join(self.entry_path(key), self.INFO_FILE), 'w') as f:
+            f.write(json.dumps(info, indent=1, sort_keys=True, default=str))
+
+    def info(self, key: str) -> dict:
+        info_file_path = os.path.join(self.entry_path(key), self.INFO_FILE)
+        if not os.path.isfile(info_file_path):
+            return {}
+        with open(info_file_path, 'r') as f:
+            return json.loads(f.read())
+
+    def keys(self) -> List[str]:
+        return sorted(k for k in os.listdir(self.root) if os.path.isdir(self.entry_path(k)))
+
+    def entry_bytes(self, key: str) -> int:
+        size = 0
+        for dirpath, _, filenames in os.walk(self.entry_path(key)):
+            size += sum(os.path.getsize(os.path.join(dirpath, f)) for f in filenames)
+        return size
+
+    def evict(self, keep: Iterable[str] = ()) -> Dict[str, int]:
+        """Delete least recently used entries until the cache fits in `max_bytes`.
+        Entries in `keep` (e.g. the ones the current training uses) are never deleted.
+        Returns a dict with <key>: <freed bytes>."""
+
+        if self.max_bytes is None:
+            return {}
+
+        keep = set(keep)
+        sizes = {k: self.entry_bytes(k) for k in self.keys()}
+        total = sum(sizes.values())
+        candidates = sorted(
+            (k for k in sizes if k not in keep),
+            key=lambda k: self.info(k).get('last_used', 0.)
+        )
+
+        evicted = {}
+        for k in candidates:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self.entry_path(k), ignore_errors=True)
+            total -= sizes[k]
+            evicted[k] = sizes[k]
+        return evicted
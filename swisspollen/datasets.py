@@ -0,0 +1,113 @@
+"""Dataset definitions, sizes and class statistics."""
+import json
+import os
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import func
+
+# seconds a counted dataset size is reused before the dataset is counted again
+DATASET_SIZES_MAX_AGE = 24 * 3600
+
+
+def get_dataset_mapping(ds_map: dict, collections: List[str], classes: Iterable[str]) -> Dict[str, str]:
+    """This method filters a dataset definition for specific systems and class labels
+    and returns a flat dictionary with { <dataset-id>: <class-label> } """
+
+    ret = {}
+    for c in collections:
+        ret.update(
+            { key: value for key, value in ds_map[c].items() if value in classes}
+        )
+    return ret
+
+
+def query_dataset_sizes(session, dataset_ids: Iterable[str]) -> Dict[str, int]:
+    """Return a dict with <dataset-id>: <number of events>, counted with a single grouped query."""
+    import poleno_db_interface.database.model.data_explorer_model as dem
+
+    dataset_ids = list(dataset_ids)
+    if len(dataset_ids) == 0:
+        return {}
+    ids_by_bytes = {uuid.UUID(k).bytes: k for k in dataset_ids}
+
+    result = session.query(
+        dem.EventsInEventDataset.dataset_id,
+        func.count(dem.EventsInEventDataset.event_id)
+    ).filter(
+        dem.EventsInEventDataset.dataset_id.in_(list(ids_by_bytes.keys()))
+    ).group_by(
+        dem.EventsInEventDataset.dataset_id
+    ).all()
+
+    dataset_sizes = {k: 0 for k in dataset_ids} # empty datasets do not show up in the grouped result
+    for dataset_id, count in result:
+        dataset_sizes[ids_by_bytes[bytes(dataset_id)]] = count
+    return dataset_sizes
+
+
+def get_dataset_sizes(
+    session,
+    ds_map_flat: dict,
+    cache_file_path: Optional[str] = None,
+    max_age: Optional[float] = DATASET_SIZES_MAX_AGE,
+    refresh: bool = False,
+) -> Dict[str, int]:
+    """Return a dict with <dataset-id>: <class-size>
+
+    Sizes are read from the JSON file `cache_file_path` (keyed by dataset id), and the datasets that are not in it
+    or whose entry is older than `max_age` seconds (a day by default) are counted in the database with one grouped
+    query. `max_age=0` recounts every dataset, `max_age=None` uses the file as long as it has the dataset (e.g.
+    without a `session`). Use `refresh=True` to recount everything and rewrite the file.
+    """
+
+    cache = {}
+    if cache_file_path is not None and not refresh and os.path.isfile(cache_file_path):
+        with open(cache_file_path, 'r') as f:
+            cache = json.loads(f.read())
+
+    dataset_ids = list(ds_map_flat.keys())
+    now = time.time()
+    stale = [
+        k for k in dataset_ids
+        if k not in cache or (max_age is not None and now - cache[k]['cached_at'] >= max_age)
+    ]
+
+    if len(stale) > 0:
+        if session is None:
+            raise ValueError(f'{len(stale)} dataset sizes are not in {cache_file_path} and there is no session to count them')
+        for k, size in query_dataset_sizes(session, stale).items():
+            cache[k] = {'size': size, 'cached_at': now}
+        if cache_file_path is not None:
+            os.makedirs(os.path.dirname(cache_file_path) or '.', exist_ok=True)
+            with open(cache_file_path, 'w') as f:
+                f.write(json.dumps(cache, indent=1))
+
+    return {k: cache[k]['size'] for k in dataset_ids}
+
+
+def get_class_sizes(ds_map_flat: dict, dataset_sizes: dict) -> Dict[str, int]:
+    """Return a dict with <class-name>: <class-size>"""
+
+    class_sizes = {}
+    for k, v in ds_map_flat.items():
+        size = dataset_sizes[k]
+        if v not in class_sizes: class_sizes[v] = 0
+        class_sizes[v] += size
+    return class_sizes
+
+
+def get_sorted_class_list(ds_map_flat: dict) -> List[str]:
+    return sorted(list(set(ds_map_flat.values())))
+
+
+def get_class_ratios(class_sizes: dict, classes: List[str], power: float = 0.) -> np.ndarray:
+    """Return the fraction of the training events to draw from every class of `classes`, proportional to
+    <class-size> ** `power`: 0 draws all classes equally, 1 with their natural frequencies, and values in between
+    soften the imbalance without repeating the smallest classes as often."""
+
+    sizes = np.array([class_sizes[c] for c in classes], dtype=np.float64)
+    ratios = np.where(sizes > 0, sizes ** power, 0.) # a class without events is never drawn
+    return ratios / ratios.sum()
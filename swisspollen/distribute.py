@@ -0,0 +1,65 @@
+"""Data-parallel training with tf.distribute: one replica per accelerator (or logical CPU), locally or across workers."""
+import json
+import os
+
+import tensorflow as tf
+
+DISTRIBUTIONS = ['one_device', 'mirrored', 'multi_worker']
+
+
+def logical_cpus(n: int):
+    """Split the CPU into `n` logical devices, e.g. to try the 'mirrored' distribution on a machine without GPU.
+    Must be called before TensorFlow initializes its devices."""
+
+    cpu = tf.config.list_physical_devices('CPU')[0]
+    tf.config.set_logical_device_configuration(cpu, [tf.config.LogicalDeviceConfiguration() for _ in range(n)])
+
+
+def get_strategy(distribution: str = 'one_device') -> tf.distribute.Strategy:
+    """Return the strategy of `distribution`:
+    - 'one_device': the first GPU, or the CPU if there is none
+    - 'mirrored': one replica per local GPU, or per logical CPU if there is no GPU (see `logical_cpus`)
+    - 'multi_worker': one replica per GPU (or CPU) of every worker of the cluster described by the TF_CONFIG
+      environment variable. It must be created before any other TensorFlow op runs.
+    """
+
+    if distribution == 'multi_worker':
+        return tf.distribute.MultiWorkerMirroredStrategy()
+    gpus = tf.config.list_logical_devices('GPU')
+    if distribution == 'one_device':
+        return tf.distribute.OneDeviceStrategy(device=gpus[0].name if len(gpus) > 0 else '/cpu:0')
+    if distribution == 'mirrored':
+        devices = [d.name for d in (gpus if len(gpus) > 0 else tf.config.list_logical_devices('CPU'))]
+        return tf.distribute.MirroredStrategy(devices=devices)
+    raise ValueError(f'unknown distribution {distribution!r}, expected one of {DISTRIBUTIONS}')
+
+
+def shard_by_data(tf_dataset: tf.data.Dataset) -> tf.data.Dataset:
+    """Auto-shard `tf_dataset` by elements among the workers (each worker keeps its share of every global batch).
+    Cached datasets have no input files to shard by. Every worker must read the same elements in the same order,
+    i.e. shuffle with the same seed."""
+
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.DATA
+    return tf_dataset.with_options(options)
+
+
+def is_chief() -> bool:
+    """Whether this process is the chief of the cluster in TF_CONFIG (or there is no cluster): the only one that
+    keeps the files shared by all workers."""
+
+    tf_config = json.loads(os.environ.get('TF_CONFIG', '{}'))
+    task = tf_config.get('task', {})
+    if 'chief' in tf_config.get('cluster', {}):
+        return task.get('type') == 'chief'
+    return task.get('type', 'worker') == 'worker' and task.get('index', 0) == 0
+
+
+def worker_path(path: str) -> str:
+    """Return `path` on the chief, and a path of this worker's own next to it on the other workers."""
+
+    if is_chief():
+        return path
+    task = json.loads(os.environ['TF_CONFIG'])['task']
+    path = path.rstrip(os.sep)
+    return os.path.join(os.path.dirname(path), f'workertemp_{task["type"]}_{task["index"]}_{os.path.basename(path)}')
@@ -0,0 +1,141 @@
+"""Frozen-backbone transfer learning: the backbone's pooled embeddings of every event are computed once, stored
+memory-mapped as float16, and only the head is trained on them."""
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from swisspollen.resume import DataPosition
+
+
+def build_embedder(
+    backbone: str = 'EfficientNetB0',
+    img_shape: Tuple[int, int, int] = (200, 200, 1),
+    weights: str = 'imagenet',
+) -> keras.Model:
+    """Return a frozen model mapping one hologram in [0, 1] to the pooled embedding of the ImageNet pre-trained
+    `backbone` (name of a `keras.applications` model, e.g. EfficientNetB0 - EfficientNetB7)."""
+
+    net = getattr(keras.applications, backbone)(
+        input_shape=img_shape[:2] + (3,),
+        include_top=False,
+        weights=weights,
+        pooling='avg',
+    )
+    net.trainable = False
+
+    image = keras.layers.Input(shape=img_shape)
+    x = keras.layers.Concatenate()([image, image, image])
+    x = x * 255 # effnet expects [0, 255] data range
+    embedding = net(x, training=False)
+    return keras.Model(inputs=image, outputs=embedding, name=f'{backbone}_embedder')
+
+
+def build_head_and_model(embedder: keras.Model, num_classes: int, dropout: float = .4) -> Tuple[keras.Model, keras.Model]:
+    """Return (head, model) sharing the same head layers:
+    - head: inputs 'rec0' and 'rec1' are embeddings, to be trained on `Embeddings.dataset()`
+    - model: inputs 'rec0' and 'rec1' are holograms, output 'target', the model to save and use for inference"""
+
+    concat = keras.layers.Concatenate()
+    drop = keras.layers.Dropout(dropout)
+    target = keras.layers.Dense(num_classes, activation='sigmoid', name='target')
+
+    dim = embedder.output_shape[-1]
+    e0 = keras.layers.Input(shape=[dim], name='rec0')
+    e1 = keras.layers.Input(shape=[dim], name='rec1')
+    head = keras.Model(inputs=[e0, e1], outputs=[target(drop(concat([e0, e1])))], name='head')
+
+    img_shape = embedder.input_shape[1:]
+    input0 = keras.layers.Input(shape=img_shape, name='rec0')
+    input1 = keras.layers.Input(shape=img_shape, name='rec1')
+    outputs = target(drop(concat([embedder(input0), embedder(input1)])))
+    model = keras.Model(inputs=[input0, input1], outputs=[outputs])
+
+    return head, model
+
+
+def data_path(path: str) -> str:
+    return path + '.embeddings'
+
+
+def labels_path(path: str) -> str:
+    return path + '.labels.npy'
+
+
+def compute_embeddings(embedder: keras.Model, pipeline: tf.data.Dataset, path: str) -> 'Embeddings':
+    """Store the embeddings of 'rec0' and 'rec1' of every event of a (features, labels) pipeline (e.g.
+    `dataset.get_data_pipeline()`) as a (num_events, 2, dim) float16 file, and their targets next to it.
+    The pipeline must be a single pass over the events, not the resumable training pipeline, which skips the
+    batches a resumed training was past. The targets file is written last, so an interrupted run leaves no partial
+    embeddings behind."""
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    embed = tf.function(lambda features: tf.stack([embedder(features['rec0']), embedder(features['rec1'])], axis=1))
+
+    targets = []
+    with open(data_path(path), 'wb') as f:
+        for features, labels in pipeline:
+            f.write(embed(features).numpy().astype(np.float16).tobytes())
+            targets.append(labels['target'].numpy())
+
+    np.save(labels_path(path), np.concatenate(targets) if len(targets) > 0 else np.zeros(0, dtype=np.int64))
+    return Embeddings(path)
+
+
+class Embeddings:
+    """Read-only, memory-mapped embeddings written by `compute_embeddings`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.targets = np.load(labels_path(path))
+        size = os.path.getsize(data_path(path)) // np.dtype(np.float16).itemsize
+        dim = size // (2 * len(self.targets)) if len(self.targets) > 0 else 0
+        self.data = np.memmap(data_path(path), dtype=np.float16, mode='r', shape=(len(self.targets), 2, dim)) if size > 0 else np.zeros((0, 2, 0), dtype=np.float16)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.isfile(labels_path(path))
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    def _gather(self, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        indices = np.sort(indices) # sequential reads from the memory map
+        return self.data[indices].astype(np.float32), self.targets[indices]
+
+    def dataset(
+        self,
+        batch_size: int,
+        shuffle: bool = False,
+        seed: int = None,
+        position: Optional[DataPosition] = None,
+        class_ratios: Optional[List[float]] = None,
+    ) -> tf.data.Dataset:
+        """Return a (features, labels) pipeline of embedding batches, like `get_data_pipeline()`, reshuffled every epoch
+        if `shuffle` (in the resumable order of `position` if given). With `class_ratios` (and `position`), endless
+        batches are drawn from the events of every class with these ratios instead (see `DataPosition.sampled`).
+        Batches are gathered from the memory map, so the embeddings never need to fit in memory."""
+
+        dim = self.data.shape[2]
+        ds = tf.data.Dataset.range(len(self))
+        if class_ratios is not None:
+            class_streams = [
+                tf.data.Dataset.from_tensor_slices(np.flatnonzero(self.targets == k).astype(np.int64))
+                for k in range(len(class_ratios))
+            ]
+            ds = position.sampled(class_streams, class_ratios, len(self), batch_size)
+        elif position is not None:
+            ds = position.shuffled(ds, len(self), batch_size)
+        elif shuffle:
+            ds = ds.shuffle(len(self), seed=seed, reshuffle_each_iteration=True).batch(batch_size)
+        else:
+            ds = ds.batch(batch_size)
+
+        def load(indices) -> Tuple[Dict[str, tf.Tensor], Dict[str, tf.Tensor]]:
+            embeddings, targets = tf.numpy_function(self._gather, [indices], [tf.float32, tf.as_dtype(self.targets.dtype)])
+            embeddings = tf.ensure_shape(embeddings, [None, 2, dim])
+            return {'rec0': embeddings[:, 0], 'rec1': embeddings[:, 1]}, {'target': tf.ensure_shape(targets, [None])}
+
+        return ds.map(load, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
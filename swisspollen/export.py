@@ -0,0 +1,422 @@
+"""Inference-only export of a trained model, next to its `model_info.json`: a frozen SavedModel signature (variables
+turned into constants, constant-folded by Grappler, no Keras needed to load it; a plain SavedModel signature with
+TensorFlow versions the freezing is not known to work with) and an optional post-training int8
+TFLite model calibrated on validation events. The artifacts are compared to the float Keras model (accuracy and
+throughput) and `load_inference_model` picks the fastest one that is accurate enough."""
+import abc
+import json
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+INFERENCE_DIR = 'inference'
+FROZEN_DIR = 'frozen'
+TFLITE_FILE = 'model_int8.tflite'
+REPORT_FILE = 'export_info.json'
+# artifacts, from the float Keras model (the reference) to the most optimized
+ARTIFACTS = ['keras', 'frozen', 'int8']
+# names of the holo image inputs of the old models
+LEGACY_INPUTS = {'rec0': 'input_1', 'rec1': 'input_2'}
+# (oldest, newest) TensorFlow versions `freeze` was tested with: it relies on TensorFlow internals (the conversion of
+# variables to constants and Grappler) that are not part of the public API. The Docker image pins 2.9.
+FREEZE_TF_VERSIONS = ((2, 9), (2, 15))
+
+
+def input_mapping(input_names: Iterable[str], feature_names: Iterable[str]) -> Dict[str, str]:
+    """Return <model-input>: <feature-name> for the inputs of a model, the old models' inputs ('input_1',
+    'input_2') fed with 'rec0' and 'rec1'."""
+
+    feature_names = set(feature_names)
+    legacy = {v: k for k, v in LEGACY_INPUTS.items()}
+    return {name: name if name in feature_names else legacy[name] for name in input_names}
+
+
+def select_inputs(features: Dict[str, tf.Tensor], input_names: Iterable[str]) -> Dict[str, tf.Tensor]:
+    """Return the features the model takes, by model input name (see `input_mapping`)."""
+    return {name: features[feature] for name, feature in input_mapping(input_names, features).items()}
+
+
+def top_class(probabilities: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+    """Return the index of the most probable class of every event and its probability."""
+    return tf.argmax(probabilities, axis=-1, output_type=tf.int32), tf.reduce_max(probabilities, axis=-1)
+
+
+def input_specs(model: keras.Model) -> Dict[str, tf.TensorSpec]:
+    """Return the spec of every input of `model` by name, with a variable batch size."""
+    return {
+        name: tf.TensorSpec((None,) + tuple(t.shape[1:]), t.dtype, name=name)
+        for name, t in zip(model.input_names, model.inputs)
+    }
+
+
+def tf_version() -> Tuple[int, int]:
+    return tuple(int(v) for v in tf.__version__.split('.')[:2])
+
+
+def freezing_supported() -> bool:
+    """Whether this TensorFlow version is in `FREEZE_TF_VERSIONS` and has the internals `freeze` uses."""
+
+    if not FREEZE_TF_VERSIONS[0] <= tf_version() <= FREEZE_TF_VERSIONS[1]:
+        return False
+    try:
+        from tensorflow.python.framework import convert_to_constants
+        from tensorflow.python.grappler import tf_optimizer
+    except ImportError:
+        return False
+    return True
+
+
+def fold_constants(graph_def: tf.compat.v1.GraphDef, output_names: List[str]) -> tf.compat.v1.GraphDef:
+    """Run Grappler's constant folding (and the arithmetic and dependency simplifications that expose more of it)
+    on a frozen graph, keeping `output_names`."""
+    from tensorflow.python.grappler import tf_optimizer
+
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.graph_util.import_graph_def(graph_def, name='')
+    meta_graph = tf.compat.v1.train.export_meta_graph(graph_def=graph_def, graph=graph)
+    fetch_collection = meta_graph.collection_def['train_op'] # the nodes Grappler must keep
+    fetch_collection.node_list.value.extend(output_names)
+
+    config = tf.compat.v1.ConfigProto()
+    rewrite_options = config.graph_options.rewrite_options
+    rewrite_options.optimizers.extend(['constfold', 'arithmetic', 'dependency'])
+    return tf_optimizer.OptimizeGraph(config, meta_graph)
+
+
+class FrozenModule(tf.Module):
+    """Module with a single `serve` function: the frozen graph of a model, its weights stored as constants."""
+
+    def __init__(self, graph_def: tf.compat.v1.GraphDef, specs: Dict[str, tf.TensorSpec], inputs: Dict[str, str], output: str):
+        super().__init__()
+
+        @tf.function(input_signature=[specs])
+        def serve(features):
+            target, = tf.graph_util.import_graph_def(
+                graph_def,
+                input_map={inputs[k]: features[k] for k in specs},
+                return_elements=[output],
+                name='frozen',
+            )
+            return {'target': target}
+
+        self.serve = serve
+
+
+class ServingModule(tf.Module):
+    """Module with a single `serve` function calling a model, its weights saved as variables: the plain SavedModel
+    signature `freeze` falls back to."""
+
+    def __init__(self, model: keras.Model):
+        super().__init__()
+        self.model = model
+
+        @tf.function(input_signature=[input_specs(model)])
+        def serve(features):
+            return {'target': tf.nest.flatten(model(features, training=False))[0]}
+
+        self.serve = serve
+
+
+def freeze(model: keras.Model) -> tf.Module:
+    """Return the inference graph of `model` (dropout off) with its variables as constants, constant-folded, or the
+    model's plain `ServingModule` if this TensorFlow version is not supported (see `freezing_supported`)."""
+
+    if not freezing_supported():
+        print(f'freezing is not supported with TensorFlow {tf.__version__}, the model is exported as a plain SavedModel signature')
+        return ServingModule(model)
+
+    from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+    specs = input_specs(model)
+    concrete = tf.function(lambda features: tf.nest.flatten(model(features, training=False))[0]).get_concrete_function(specs)
+    frozen = convert_variables_to_constants_v2(concrete)
+    # the placeholders follow the flattened (key-sorted) input dict
+    inputs = {k: t.name for k, t in zip(sorted(specs), frozen.inputs)}
+    output = frozen.outputs[0].name
+    graph_def = fold_constants(frozen.graph.as_graph_def(), [output.split(':')[0]])
+    return FrozenModule(graph_def, specs, inputs, output)
+
+
+def quantize_int8(model: keras.Model, calibration: List[Dict[str, np.ndarray]]) -> bytes:
+    """Return the TFLite model of `model` with int8 weights and activations, the activation ranges calibrated on the
+    events of `calibration` (float inputs and outputs, ops without an int8 kernel stay in float)."""
+
+    def representative_dataset():
+        for features in calibration:
+            yield [features[name] for name in model.input_names]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+    return converter.convert()
+
+
+class Predictor(abc.ABC):
+    """Class probabilities of the events by an artifact. `predict` computes them `batch_size` events at a time (like
+    `keras.Model.predict`) whatever the size of the batches given. `predict_batch` and `classify_batch` take one
+    batch of inputs keyed by `input_names`, and `classifier` resolves those names once for a stream of batches."""
+
+    artifact = None
+
+    def __init__(self, batch_size: int = 32):
+        self.batch_size = batch_size
+        self.input_names: List[str] = []
+
+    @abc.abstractmethod
+    def predict_batch(self, inputs: Dict[str, tf.Tensor]) -> np.ndarray:
+        """Return the class probabilities of one batch of inputs."""
+
+    def classify_batch(self, inputs: Dict[str, tf.Tensor]) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the index of the predicted class of every event of a batch and its probability."""
+
+        probabilities = self.predict_batch(inputs)
+        return np.argmax(probabilities, axis=-1), np.max(probabilities, axis=-1)
+
+    def predict(self, features: Dict[str, tf.Tensor]) -> np.ndarray:
+        """Return the class probabilities of a batch of events."""
+
+        inputs = select_inputs(features, self.input_names)
+        num_events = len(next(iter(inputs.values())))
+        return np.concatenate([
+            self.predict_batch({k: v[first:first + self.batch_size] for k, v in inputs.items()})
+            for first in range(0, num_events, self.batch_size)
+        ])
+
+    def classifier(self, feature_names: Iterable[str]) -> Callable[[Dict[str, tf.Tensor]], Tuple[np.ndarray, np.ndarray]]:
+        """Return `classify_batch` for batches of the features `feature_names` (e.g. the keys of a dataset's
+        features), the model inputs they feed resolved once."""
+
+        mapping = input_mapping(self.input_names, feature_names)
+
+        def classify(features: Dict[str, tf.Tensor]) -> Tuple[np.ndarray, np.ndarray]:
+            return self.classify_batch({name: features[feature] for name, feature in mapping.items()})
+
+        return classify
+
+
+class GraphPredictor(Predictor):
+    """Predictor running a TensorFlow function `serve` of the inputs (specs `specs`, by input name) returning the
+    class probabilities. It is compiled once for the input signature and any batch size, with the top class
+    computed in the graph."""
+
+    def __init__(self, serve: Callable[[Dict[str, tf.Tensor]], tf.Tensor], specs: Dict[str, tf.TensorSpec], batch_size: int = 32):
+        super().__init__(batch_size)
+        self.input_names = list(specs)
+        self._probabilities = tf.function(serve, input_signature=[specs])
+        self._top_class = tf.function(lambda inputs: top_class(serve(inputs)), input_signature=[specs])
+
+    def predict_batch(self, inputs: Dict[str, tf.Tensor]) -> np.ndarray:
+        return self._probabilities(inputs).numpy()
+
+    def classify_batch(self, inputs: Dict[str, tf.Tensor]) -> Tuple[np.ndarray, np.ndarray]:
+        class_index, certainty = self._top_class(inputs)
+        return class_index.numpy(), certainty.numpy()
+
+
+class KerasPredictor(GraphPredictor):
+    """Float Keras model, the reference of the other artifacts."""
+
+    artifact = 'keras'
+
+    def __init__(self, model: keras.Model, batch_size: int = 32):
+        self.model = model
+        super().__init__(lambda inputs: tf.nest.flatten(model(inputs, training=False))[0], input_specs(model), batch_size)
+
+    @classmethod
+    def load(cls, model_dir: str, batch_size: int = 32) -> 'KerasPredictor':
+        return cls(keras.models.load_model(model_dir, compile=False), batch_size)
+
+
+class FrozenPredictor(GraphPredictor):
+    """Frozen (or plain) SavedModel signature (see `freeze`)."""
+
+    artifact = 'frozen'
+
+    def __init__(self, path: str, batch_size: int = 32):
+        self.module = tf.saved_model.load(path)
+        serve = self.module.signatures['serving_default']
+        super().__init__(lambda inputs: serve(**inputs)['target'], serve.structured_input_signature[1], batch_size)
+
+
+class TFLitePredictor(Predictor):
+    """int8 TFLite model (see `quantize_int8`), run by the TFLite interpreter on the CPU. The inputs are resized to
+    the batch size when it changes."""
+
+    artifact = 'int8'
+
+    def __init__(self, path: str, batch_size: int = 32, num_threads: Optional[int] = None):
+        super().__init__(batch_size)
+        self.interpreter = tf.lite.Interpreter(model_path=path, num_threads=num_threads or os.cpu_count())
+        self.interpreter.allocate_tensors()
+        # the inputs are named <signature>_<input>:0
+        self.inputs = {d['name'].split(':')[0].split('serving_default_')[-1]: d['index'] for d in self.interpreter.get_input_details()}
+        self.input_names = list(self.inputs)
+        self.output = self.interpreter.get_output_details()[0]['index']
+        self.input_batch_size = None
+
+    def predict_batch(self, inputs: Dict[str, tf.Tensor]) -> np.ndarray:
+        batch_size = len(next(iter(inputs.values())))
+        if batch_size != self.input_batch_size:
+            for name, index in self.inputs.items():
+                self.interpreter.resize_tensor_input(index, (batch_size,) + tuple(inputs[name].shape[1:]))
+            self.interpreter.allocate_tensors()
+            self.input_batch_size = batch_size
+        for name, index in self.inputs.items():
+            self.interpreter.set_tensor(index, np.asarray(inputs[name], dtype=np.float32))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output).copy()
+
+
+def inference_path(model_dir: str, artifact: str) -> str:
+    if artifact == 'keras':
+        return model_dir
+    return os.path.join(model_dir, INFERENCE_DIR, FROZEN_DIR if artifact == 'frozen' else TFLITE_FILE)
+
+
+def load_predictor(model_dir: str, artifact: str, batch_size: int = 32) -> Predictor:
+    """Return the predictor of `artifact` ('keras', 'frozen' or 'int8') of the model saved in `model_dir`."""
+
+    if artifact == 'keras':
+        return KerasPredictor.load(model_dir, batch_size)
+    if artifact == 'frozen':
+        return FrozenPredictor(inference_path(model_dir, artifact), batch_size)
+    if artifact == 'int8':
+        return TFLitePredictor(inference_path(model_dir, artifact), batch_size)
+    raise ValueError(f'unknown artifact {artifact!r}, expected one of {ARTIFACTS}')
+
+
+def read_report(model_dir: str) -> Optional[dict]:
+    report_file_path = os.path.join(model_dir, INFERENCE_DIR, REPORT_FILE)
+    if not os.path.isfile(report_file_path):
+        return None
+    with open(report_file_path, 'r') as f:
+        return json.loads(f.read())
+
+
+def fastest_artifact(model_dir: str, max_accuracy_drop: float = 0.005) -> str:
+    """Return the artifact of the model in `model_dir` with the highest measured throughput whose accuracy is at
+    most `max_accuracy_drop` below the float model's (or, without labels, that agrees with it as often). Without a
+    report, the frozen model if it was exported (it computes the same as the float model), else the Keras model."""
+
+    available = [a for a in ARTIFACTS if os.path.exists(inference_path(model_dir, a))]
+    report = read_report(model_dir)
+    if report is None:
+        return 'frozen' if 'frozen' in available else 'keras'
+
+    results = report['artifacts']
+    reference = results['keras']
+    def accurate(result: dict) -> bool:
+        if result.get('accuracy') is not None and reference.get('accuracy') is not None:
+            return reference['accuracy'] - result['accuracy'] <= max_accuracy_drop
+        return 1. - result['agreement'] <= max_accuracy_drop
+    candidates = [a for a in available if a in results and accurate(results[a])]
+    return max(candidates, key=lambda a: results[a]['events_per_s'])
+
+
+def load_inference_model(
+    model_dir: str,
+    artifact: Optional[str] = None,
+    max_accuracy_drop: float = 0.005,
+    batch_size: int = 32,
+) -> Predictor:
+    """Return the predictor of the fastest artifact of the model saved in `model_dir` (see `fastest_artifact`), or
+    of `artifact`."""
+
+    artifact = artifact or fastest_artifact(model_dir, max_accuracy_drop)
+    print(f'loading the {artifact} model ({inference_path(model_dir, artifact)})')
+    return load_predictor(model_dir, artifact, batch_size)
+
+
+def load_sample(tf_dataset: tf.data.Dataset, num_events: int, batch_size: int, skip: int = 0) -> List[Tuple[dict, Optional[np.ndarray]]]:
+    """Return `num_events` events of a batched (features, targets) dataset, after the first `skip`, as
+    (features, labels) NumPy batches."""
+
+    batches = []
+    for features, targets in tf_dataset.unbatch().skip(skip).take(num_events).batch(batch_size):
+        labels = tf.nest.flatten(targets)[0].numpy() if targets is not None else None
+        batches.append(({k: v.numpy() for k, v in features.items()}, labels))
+    return batches
+
+
+def benchmark(predictor: Predictor, batches: List[Tuple[dict, Optional[np.ndarray]]], reference: Optional[List[np.ndarray]] = None) -> Tuple[dict, List[np.ndarray]]:
+    """Return the throughput and accuracy of `predictor` on `batches` (already in memory), its agreement with the
+    predicted classes of the `reference` probabilities, and its probabilities."""
+
+    predictor.predict(batches[0][0]) # warm-up: tracing, allocation
+    start = time.perf_counter()
+    probabilities = [predictor.predict(features) for features, _ in batches]
+    elapsed = time.perf_counter() - start
+
+    events = sum(len(p) for p in probabilities)
+    predicted = np.concatenate([np.argmax(p, axis=-1) for p in probabilities])
+    result = {'events': events, 'events_per_s': events / elapsed, 'ms_per_event': elapsed * 1e3 / events}
+    labels = [y for _, y in batches]
+    result['accuracy'] = float(np.mean(predicted == np.concatenate(labels))) if all(y is not None for y in labels) else None
+    if reference is not None:
+        result['agreement'] = float(np.mean(predicted == np.concatenate([np.argmax(p, axis=-1) for p in reference])))
+        result['max_abs_diff'] = float(max(np.abs(p - r).max() for p, r in zip(probabilities, reference)))
+    else:
+        result['agreement'], result['max_abs_diff'] = 1., 0.
+    return result, probabilities
+
+
+def export_inference(
+    model: keras.Model,
+    model_dir: str,
+    sample: tf.data.Dataset,
+    int8: bool = True,
+    calibration_events: int = 256,
+    benchmark_events: int = 1024,
+    batch_size: int = 32,
+    device: str = '/cpu:0',
+) -> dict:
+    """Export the inference artifacts of `model` to <model_dir>/inference/ and return their report, also written to
+    `REPORT_FILE` there.
+
+    `sample` is a (features, targets) dataset of validation events (e.g. `dataset_val.get_data_pipeline()`): the
+    first `calibration_events` calibrate the int8 model, the next `benchmark_events` measure the accuracy and
+    throughput of every artifact, predicting `batch_size` events at a time, on `device` (the CPU, as in
+    validation.ipynb).
+    """
+
+    inference_dir = os.path.join(model_dir, INFERENCE_DIR)
+    os.makedirs(inference_dir, exist_ok=True)
+
+    frozen_path = inference_path(model_dir, 'frozen')
+    module = freeze(model)
+    tf.saved_model.save(module, frozen_path, signatures={'serving_default': module.serve})
+    print(f'frozen model saved to {frozen_path}')
+
+    if int8:
+        calibration = [features for features, _ in load_sample(sample, calibration_events, 1)]
+        with open(inference_path(model_dir, 'int8'), 'wb') as f:
+            f.write(quantize_int8(model, calibration))
+        print(f"int8 model saved to {inference_path(model_dir, 'int8')}")
+    elif os.path.isfile(inference_path(model_dir, 'int8')):
+        os.remove(inference_path(model_dir, 'int8')) # left by a previous export, no longer matches the model
+
+    batches = load_sample(sample, benchmark_events, batch_size, skip=calibration_events if int8 else 0)
+    report = {'device': device, 'batch_size': batch_size, 'artifacts': {}}
+    with tf.device(device):
+        reference = None
+        predictors = [KerasPredictor(model, batch_size), FrozenPredictor(frozen_path, batch_size)]
+        if int8:
+            predictors.append(TFLitePredictor(inference_path(model_dir, 'int8'), batch_size))
+        for predictor in predictors:
+            result, probabilities = benchmark(predictor, batches, reference)
+            reference = reference if reference is not None else probabilities
+            report['artifacts'][predictor.artifact] = result
+            print(
+                f"{predictor.artifact}: {result['events_per_s']:.1f} events/s"
+                + (f", accuracy {result['accuracy']:.2%}" if result['accuracy'] is not None else '')
+                + f", agreement with the float model {result['agreement']:.2%}"
+            )
+    with open(os.path.join(inference_dir, REPORT_FILE), 'w') as f:
+        f.write(json.dumps(report, indent=1))
+    return report
@@ -0,0 +1,103 @@
+"""Data filters running as pure TF ops on whole batches of events."""
+from functools import lru_cache
+from typing import Callable, Dict
+
+import numpy as np
+import tensorflow as tf
+
+
+@lru_cache(maxsize=None)
+def border_mask(height: int, width: int) -> np.ndarray:
+    """Return a (height, width, 1) float mask which is 1 on the image border and 0 elsewhere."""
+
+    mask = np.zeros((height, width, 1), dtype=np.float32)
+    mask[[0, -1], :] = 1.
+    mask[:, [0, -1]] = 1.
+    return mask
+
+
+def crop_ratio(images: tf.Tensor, BT: float = .85) -> tf.Tensor:
+    """Return the (batch,) fraction of border pixels darker than `BT`, as float64.
+    `images` has shape (batch, height, width, 1)."""
+
+    mask = border_mask(int(images.shape[1]), int(images.shape[2]))
+    dark = tf.reduce_sum(tf.cast(images < BT, tf.float32) * mask, axis=[1, 2, 3])
+    return tf.cast(dark, tf.float64) / float(mask.sum())
+
+
+def is_cropped(images: tf.Tensor, T: float = .0001, BT: float = .85) -> tf.Tensor:
+    """Return a (batch,) bool tensor, True where the particle is cropped, i.e. where the fraction
+    of border pixels darker than `BT` is above `T`."""
+
+    return crop_ratio(images, BT) > T
+
+
+def filter_crop(features: Dict[str, tf.Tensor], T: float = .0001, BT: float = .85) -> tf.Tensor:
+    """Return a (batch,) bool tensor, True for the events whose particle is cropped on neither image"""
+
+    return tf.logical_and(
+        tf.logical_not(is_cropped(features['rec0'], T, BT)),
+        tf.logical_not(is_cropped(features['rec1'], T, BT))
+    )
+
+
+# kernel of cv2.Laplacian with the default ksize=1
+LAPLACIAN_KERNEL = np.array([
+    [0., 1., 0.],
+    [1., -4., 1.],
+    [0., 1., 0.],
+], dtype=np.float32).reshape(3, 3, 1, 1)
+
+
+def reflect_pad(images: tf.Tensor, n: int) -> tf.Tensor:
+    """Pad the height and width of (batch, height, width, channels) images by `n` pixels, reflected
+    without repeating the edge pixel like OpenCV's default BORDER_REFLECT_101.
+    Same result as tf.pad(..., mode='REFLECT') but noticeably faster on CPU."""
+
+    images = tf.concat([images[:, n:0:-1], images, images[:, -2:-n - 2:-1]], axis=1)
+    return tf.concat([images[:, :, n:0:-1], images, images[:, :, -2:-n - 2:-1]], axis=2)
+
+
+def laplacian_variance(images: tf.Tensor) -> tf.Tensor:
+    """Return the (batch,) variance of the Laplacian of each image, as `cv2.Laplacian(img, cv2.CV_32F).var()`"""
+
+    laplacian = tf.nn.conv2d(reflect_pad(images, 1), LAPLACIAN_KERNEL, strides=1, padding='VALID')
+    return tf.math.reduce_variance(laplacian, axis=[1, 2, 3])
+
+
+def filter_blur(features: Dict[str, tf.Tensor], T: float = .0014) -> tf.Tensor:
+    """Return a (batch,) bool tensor, True for the events where neither image is blurry,
+    i.e. where the variance of the Laplacian of neither image is below `T`"""
+
+    return tf.logical_and(
+        tf.logical_not(laplacian_variance(features['rec0']) < T),
+        tf.logical_not(laplacian_variance(features['rec1']) < T)
+    )
+
+
+def event_ids_of(ids) -> tf.Tensor:
+    """Return the event ids of the ids part of an (ids, features, targets) dataset element."""
+    return ids['id'] if isinstance(ids, dict) else ids
+
+
+def mask_batches(tf_dataset: tf.data.Dataset, keep_fn: Callable[..., tf.Tensor]) -> tf.data.Dataset:
+    """Keep the events of a batched (ids, features, targets) dataset for which `keep_fn(ids, features, targets)`,
+    a (batch,) bool tensor, is True. The batches shrink accordingly, so this is meant to be followed by `unbatch()`.
+    Batches left empty are dropped (conv2d returns wrongly shaped outputs for empty batches)."""
+
+    def mask_batch(ids, features, targets):
+        keep = keep_fn(ids, features, targets)
+        return tf.nest.map_structure(lambda x: tf.boolean_mask(x, keep), (ids, features, targets))
+
+    return tf_dataset.map(mask_batch, num_parallel_calls=tf.data.AUTOTUNE).filter(
+        lambda ids, features, targets: tf.shape(features['rec0'])[0] > 0
+    )
+
+
+def filter_batches(tf_dataset: tf.data.Dataset, *filters: Callable[[Dict[str, tf.Tensor]], tf.Tensor]) -> tf.data.Dataset:
+    """Keep the events of a batched (ids, features, targets) dataset for which all `filters` are True (see `mask_batches`)."""
+
+    return mask_batches(
+        tf_dataset,
+        lambda ids, features, targets: tf.reduce_all(tf.stack([f(features) for f in filters]), axis=0)
+    )
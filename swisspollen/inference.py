@@ -0,0 +1,94 @@
+"""Streaming inference over long runs of events (e.g. months of a device's measurements in validation.ipynb): the
+model inputs are resolved once, every batch goes through the compiled model function, and its predictions are
+written into preallocated NumPy columns. The DataFrame is built once, at the end."""
+import time
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from tqdm.auto import tqdm
+
+from swisspollen.export import Predictor
+
+
+def split_ids(ids: dict, features: dict):
+    """Map a batch of ({'id', 'timestamp'}, features) to (event ids, timestamps as float64 UNIX seconds, features)."""
+
+    timestamps = ids['timestamp']
+    if timestamps.dtype == tf.string:
+        timestamps = tf.strings.to_number(timestamps, tf.float64)
+    return ids['id'], tf.cast(timestamps, tf.float64), features
+
+
+class PredictionColumns:
+    """Preallocated columns of the predictions: event ids as fixed-width bytes, the index of the predicted class
+    (int16), its probability (float32) and the event timestamps (float64). They grow by doubling when a run has more
+    events than expected."""
+
+    def __init__(self, capacity: int = 1 << 16, id_width: int = 36):
+        self.size = 0
+        self.event_id = np.empty(capacity, dtype=f'S{id_width}')
+        self.class_index = np.empty(capacity, dtype=np.int16)
+        self.certainty = np.empty(capacity, dtype=np.float32)
+        self.timestamp = np.empty(capacity, dtype=np.float64)
+
+    def _grow(self, capacity: int):
+        for name in ['event_id', 'class_index', 'certainty', 'timestamp']:
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def append(self, event_ids: np.ndarray, class_index: np.ndarray, certainty: np.ndarray, timestamps: np.ndarray):
+        end = self.size + len(class_index)
+        if end > len(self.class_index):
+            self._grow(max(end, 2 * len(self.class_index)))
+        event_ids = event_ids.astype(bytes) # object array of bytes to fixed width
+        if event_ids.dtype.itemsize > self.event_id.dtype.itemsize:
+            self.event_id = self.event_id.astype(event_ids.dtype) # longer ids than expected, never truncated
+        self.event_id[self.size:end] = event_ids
+        self.class_index[self.size:end] = class_index
+        self.certainty[self.size:end] = certainty
+        self.timestamp[self.size:end] = timestamps
+        self.size = end
+
+    def dataframe(self, classes: List[str]) -> pd.DataFrame:
+        """Return the predictions as validation.ipynb's DataFrame: 'event_id', 'pred_class' and 'pred_certainty',
+        indexed by 'event_timestamp'."""
+
+        return pd.DataFrame(
+            {
+                'event_id': np.char.decode(self.event_id[:self.size], 'ascii'),
+                'pred_class': pd.Categorical.from_codes(self.class_index[:self.size], categories=classes),
+                'pred_certainty': self.certainty[:self.size],
+            },
+            index=pd.DatetimeIndex(pd.to_datetime(self.timestamp[:self.size], unit='s'), name='event_timestamp'),
+        )
+
+
+def predict_events(
+    predictor: Predictor,
+    tf_dataset: tf.data.Dataset,
+    classes: List[str],
+    num_events: Optional[int] = None,
+    progress: bool = True,
+) -> pd.DataFrame:
+    """Return the predicted class of every event of a batched (ids, features) dataset, ids {'id', 'timestamp'}
+    (e.g. `get_data_pipeline(with_id=True)`), and its probability (certainty), indexed by event timestamp
+    (see `PredictionColumns.dataframe`). `num_events` is the expected number of events, to preallocate the columns."""
+
+    tf_dataset = tf_dataset.map(split_ids, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+    _, _, feature_specs = tf_dataset.element_spec
+    classify = predictor.classifier(feature_specs.keys())
+    columns = PredictionColumns(num_events or 1 << 16)
+
+    start = time.perf_counter()
+    with tqdm(total=num_events, unit='event', disable=not progress, leave=False) as bar:
+        for event_ids, timestamps, features in tf_dataset:
+            class_index, certainty = classify(features)
+            columns.append(event_ids.numpy(), class_index, certainty, timestamps.numpy())
+            bar.update(len(class_index))
+    elapsed = time.perf_counter() - start
+    print(f'{columns.size} events predicted in {elapsed:.0f} s ({columns.size / max(elapsed, 1e-9):.1f} events/s, {predictor.artifact} model)')
+    return columns.dataframe(classes)
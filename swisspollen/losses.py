@@ -0,0 +1,25 @@
+"""Losses of the models trained on the holo images."""
+import tensorflow as tf
+from tensorflow import keras
+
+
+class WeightedSCCE(tf.keras.losses.Loss):
+    """Custom SparseCategoricalCrossentropy loss class that supports class weights."""
+    def __init__(self, class_weight, from_logits=False, name='weighted_scce'):
+        if class_weight is None or all(v == 1. for v in class_weight):
+            self.class_weight = None
+        else:
+            self.class_weight = tf.convert_to_tensor(class_weight,
+                dtype=tf.float32)
+        self.reduction = keras.losses.Reduction.NONE
+        self.unreduced_scce = keras.losses.SparseCategoricalCrossentropy(
+            from_logits=from_logits, name=name,
+            reduction=self.reduction)
+        self.name = name
+
+    def __call__(self, y_true, y_pred, sample_weight=None):
+        loss = self.unreduced_scce(y_true, y_pred, sample_weight)
+        if self.class_weight is not None:
+            weight_mask = tf.gather(self.class_weight, y_true)
+            loss = tf.math.multiply(loss, weight_mask)
+        return loss
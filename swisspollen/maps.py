@@ -0,0 +1,142 @@
+"""Data maps running as pure TF ops on whole batches of events."""
+from typing import Callable, Optional
+
+import numpy as np
+import tensorflow as tf
+
+from swisspollen.filters import reflect_pad
+
+# integer weights of the kernel cv2.GaussianBlur uses per axis for ksize=5 and sigma=0 ([1, 4, 6, 4, 1] / 16)
+GAUSSIAN_WEIGHTS_5 = np.array([1., 4., 6., 4., 1.], dtype=np.float32)
+
+
+def to_uint8_levels(images: tf.Tensor) -> tf.Tensor:
+    """Return images in [0, 1] as float grey levels 0..255, truncated like `(img*255).astype(np.uint8)`."""
+    return tf.floor(tf.clip_by_value(images * 255., 0., 255.))
+
+
+def gaussian_blur_5x5(levels: tf.Tensor) -> tf.Tensor:
+    """Blur grey levels as `cv2.GaussianBlur(img, (5, 5), 0)` on a uint8 image, rounded back to grey levels.
+    The kernel is applied separably with integer weights, so the sums are exact before the final rounding."""
+
+    weighted = tf.nn.conv2d(reflect_pad(levels, 2), GAUSSIAN_WEIGHTS_5.reshape(1, 5, 1, 1), strides=1, padding='VALID')
+    weighted = tf.nn.conv2d(weighted, GAUSSIAN_WEIGHTS_5.reshape(5, 1, 1, 1), strides=1, padding='VALID')
+    return tf.floor((weighted + 128.) / 256.)
+
+
+def otsu_threshold(levels: tf.Tensor) -> tf.Tensor:
+    """Return the (batch,) Otsu threshold of each image of grey levels, as `cv2.threshold(..., cv2.THRESH_OTSU)`.
+    The 256-bin histograms of the whole batch are computed with a single bincount."""
+
+    batch_size = tf.shape(levels)[0]
+    bins = tf.reshape(tf.cast(levels, tf.int32), [batch_size, -1]) + 256 * tf.range(batch_size)[:, None]
+    hist = tf.reshape(tf.math.bincount(bins, minlength=256 * batch_size, maxlength=256 * batch_size, dtype=tf.float64), [batch_size, 256])
+
+    i = tf.range(256, dtype=tf.float64)
+    p = hist / tf.reduce_sum(hist, axis=1, keepdims=True)
+    q1 = tf.cumsum(p, axis=1)
+    q2 = 1. - q1
+    m1 = tf.cumsum(i * p, axis=1)
+    mu = m1[:, -1:]
+    mu1 = tf.math.divide_no_nan(m1, q1)
+    mu2 = tf.math.divide_no_nan(mu - m1, q2)
+    sigma = q1 * q2 * tf.square(mu1 - mu2)
+    # same as OpenCV: levels leaving one class (almost) empty are skipped and the first maximum wins
+    eps = float(np.finfo(np.float32).eps)
+    valid = tf.logical_and(tf.minimum(q1, q2) >= eps, tf.maximum(q1, q2) <= 1. - eps)
+    sigma = tf.where(valid, sigma, tf.zeros_like(sigma))
+    max_sigma = tf.reduce_max(sigma, axis=1, keepdims=True)
+    first = tf.reduce_min(tf.where(tf.logical_and(sigma >= max_sigma, max_sigma > 0.), tf.cast(i, tf.int32), 256), axis=1)
+    return tf.cast(tf.where(first < 256, first, 0), tf.float32)
+
+
+def remove_waves(images: tf.Tensor) -> tf.Tensor:
+    """Remove the "waves" around the particles of (batch, height, width, 1) images in [0, 1]:
+    pixels brighter than the Otsu threshold of the blurred image are set to 0.
+
+    Same output as the former OpenCV `rmv_waves` map, i.e. grey levels 0..255 as float32 (not rescaled to [0, 1]).
+    """
+
+    levels = to_uint8_levels(images)
+    blurred = gaussian_blur_5x5(levels)
+    mask = blurred > otsu_threshold(blurred)[:, None, None, None]
+    return tf.where(mask, tf.zeros_like(levels), levels)
+
+
+def map_remove_waves(*args):
+    """Apply `remove_waves` to 'rec0' and 'rec1' of batched (ids, features, ...) dataset elements."""
+
+    features = dict(args[1])
+    features['rec0'] = remove_waves(features['rec0'])
+    features['rec1'] = remove_waves(features['rec1'])
+    return (args[0], features) + tuple(args[2:])
+
+
+
+def random_rotate(images: tf.Tensor, rng: tf.random.Generator, max_angle: float) -> tf.Tensor:
+    """Rotate each image of a batch by its own random angle in [-max_angle, max_angle] (radians),
+    filling with the nearest pixels like `tfa.image.rotate(..., fill_mode='nearest')`."""
+
+    batch_size = tf.shape(images)[0]
+    height = tf.cast(tf.shape(images)[1], tf.float32)
+    width = tf.cast(tf.shape(images)[2], tf.float32)
+    angles = rng.uniform([batch_size], -max_angle, max_angle)
+    cos, sin = tf.cos(angles), tf.sin(angles)
+    x_offset = ((width - 1.) - (cos * (width - 1.) - sin * (height - 1.))) / 2.
+    y_offset = ((height - 1.) - (sin * (width - 1.) + cos * (height - 1.))) / 2.
+    zeros = tf.zeros_like(angles)
+    transforms = tf.stack([cos, -sin, x_offset, sin, cos, y_offset, zeros, zeros], axis=1)
+    return tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=transforms,
+        output_shape=tf.shape(images)[1:3],
+        fill_value=0.,
+        interpolation='NEAREST',
+        fill_mode='NEAREST',
+    )
+
+
+def augment(
+    images: tf.Tensor,
+    rng: tf.random.Generator,
+    max_delta: float = .1,
+    contrast_range: tuple = (.7, 1.3),
+    max_angle: float = 120 * np.pi / 180.,
+) -> tf.Tensor:
+    """Randomly augment a batch of (batch, height, width, channels) images, with parameters drawn per image in the graph:
+    left-right and up-down flips, brightness, contrast and rotation (same ranges as the former `augment_using_ops`)."""
+
+    batch_size = tf.shape(images)[0]
+    per_image = lambda x: tf.reshape(x, [batch_size, 1, 1, 1])
+
+    flip = per_image(rng.uniform([batch_size]) < .5)
+    images = tf.where(flip, tf.reverse(images, axis=[2]), images)
+    flip = per_image(rng.uniform([batch_size]) < .5)
+    images = tf.where(flip, tf.reverse(images, axis=[1]), images)
+
+    images = images + per_image(rng.uniform([batch_size], -max_delta, max_delta))
+
+    mean = tf.reduce_mean(images, axis=[1, 2], keepdims=True)
+    factor = per_image(rng.uniform([batch_size], *contrast_range))
+    images = (images - mean) * factor + mean
+
+    return random_rotate(images, rng, max_angle)
+
+
+def augment_map(seed: Optional[int] = None, rng: Optional[tf.random.Generator] = None) -> Callable:
+    """Return a dataset map applying `augment` to 'rec0' and 'rec1' of batched (ids, features, ...) dataset elements.
+    The two holograms are views of the particle from different angles, so each draws its own augmentation (as the
+    former map applied `augment_using_ops` to each of them). The random generator's state lives outside the dataset
+    iterators, so every epoch draws new augmentations (reproducibly if `seed` is given). Pass your own `rng` to
+    checkpoint its state."""
+
+    if rng is None:
+        rng = tf.random.Generator.from_seed(seed) if seed is not None else tf.random.Generator.from_non_deterministic_state()
+
+    def map_augment(*args):
+        features = dict(args[1])
+        features['rec0'] = augment(features['rec0'], rng)
+        features['rec1'] = augment(features['rec1'], rng)
+        return (args[0], features) + tuple(args[2:])
+
+    return map_augment
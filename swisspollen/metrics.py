@@ -0,0 +1,103 @@
+"""Confusion matrix accumulated as a Keras metric during the regular validation pass, and logged to TensorBoard."""
+from typing import List, Optional
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from swisspollen.distribute import is_chief
+
+# last color of matplotlib's 'Blues' colormap, used for a fully populated cell
+BLUE = np.array([8, 48, 107], dtype=np.float32) / 255.
+
+
+@keras.utils.register_keras_serializable(package='swisspollen')
+class ConfusionMatrix(keras.metrics.Metric):
+    """Confusion matrix of sparse labels (rows) against the argmax of the predictions (columns),
+    accumulated over the batches of a pass (the training epoch, then the validation pass of `model.fit`).
+
+    Its scalar result is the balanced accuracy (mean recall of the classes present), the matrix itself
+    is read with `confusion_matrix()`.
+    """
+
+    def __init__(self, num_classes: int, name: str = 'balanced_accuracy', **kwargs):
+        super().__init__(name=name, **kwargs)
+        self.num_classes = num_classes
+        self.total_cm = self.add_weight(
+            'total_confusion_matrix',
+            shape=(num_classes, num_classes),
+            initializer='zeros',
+            dtype=tf.float64,
+        )
+
+    def update_state(self, y_true, y_pred, sample_weight=None):
+        labels = tf.reshape(tf.cast(y_true, tf.int64), [-1])
+        predictions = tf.argmax(tf.reshape(y_pred, [-1, self.num_classes]), axis=1)
+        if sample_weight is not None:
+            sample_weight = tf.reshape(tf.cast(sample_weight, tf.float64), [-1])
+        cm = tf.math.confusion_matrix(
+            labels, predictions, num_classes=self.num_classes, weights=sample_weight, dtype=tf.float64
+        )
+        return self.total_cm.assign_add(cm)
+
+    def confusion_matrix(self) -> tf.Tensor:
+        return tf.convert_to_tensor(self.total_cm)
+
+    def result(self):
+        support = tf.reduce_sum(self.total_cm, axis=1)
+        recall = tf.math.divide_no_nan(tf.linalg.diag_part(self.total_cm), support)
+        present = tf.cast(support > 0, tf.float64)
+        return tf.math.divide_no_nan(tf.reduce_sum(recall * present), tf.reduce_sum(present))
+
+    def reset_state(self):
+        self.total_cm.assign(tf.zeros_like(self.total_cm))
+
+    def get_config(self):
+        config = super().get_config()
+        config['num_classes'] = self.num_classes
+        return config
+
+
+def confusion_matrix_image(cm: np.ndarray, cell_size: int = 16) -> np.ndarray:
+    """Return the row-normalized confusion matrix as a (1, height, width, 3) uint8 image, one `cell_size` square per
+    cell, from white (0) to blue (1)."""
+
+    cm = np.asarray(cm, dtype=np.float64)
+    normalized = cm / np.maximum(cm.sum(axis=1, keepdims=True), 1.)
+    rgb = 1. + normalized[..., None] * (BLUE - 1.)
+    rgb = np.repeat(np.repeat(rgb, cell_size, axis=0), cell_size, axis=1)
+    return np.round(rgb * 255.).astype(np.uint8)[None]
+
+
+def confusion_matrix_text(cm: np.ndarray, class_names: List[str]) -> str:
+    """Return the confusion matrix as a markdown table (rows: true label, columns: predicted label)."""
+
+    lines = [
+        '| true \\ predicted | ' + ' | '.join(class_names) + ' |',
+        '|---' * (len(class_names) + 1) + '|',
+    ]
+    for name, row in zip(class_names, np.asarray(cm)):
+        lines.append(f'| {name} | ' + ' | '.join(f'{int(v)}' for v in row) + ' |')
+    return '\n'.join(lines)
+
+
+class ConfusionMatrixLogger(keras.callbacks.Callback):
+    """Write the validation confusion matrix of a compiled `ConfusionMatrix` metric to TensorBoard at every epoch end,
+    as a tensor, an image and a table. Nothing is predicted again: the matrix is the one the validation pass accumulated.
+    With several workers, only the chief writes (all of them read the matrix, which sums it over the workers)."""
+
+    def __init__(self, metric: ConfusionMatrix, logdir: str, class_names: Optional[List[str]] = None):
+        super().__init__()
+        self.metric = metric
+        self.class_names = class_names if class_names is not None else [str(k) for k in range(metric.num_classes)]
+        self.writer = tf.summary.create_file_writer(logdir) if is_chief() else tf.summary.create_noop_writer()
+
+    def on_epoch_end(self, epoch, logs=None):
+        if logs is not None and f'val_{self.metric.name}' not in logs:
+            return # no validation pass this epoch, the metric holds the training matrix
+        cm = self.metric.confusion_matrix().numpy()
+        with self.writer.as_default():
+            tf.summary.write('confusion_matrix', cm, step=epoch)
+            tf.summary.image('Confusion Matrix', confusion_matrix_image(cm), step=epoch)
+            tf.summary.text('Confusion Matrix', confusion_matrix_text(cm, self.class_names), step=epoch)
+        self.writer.flush()
@@ -0,0 +1,133 @@
+"""Building blocks of the models trained on the holo images."""
+from typing import List, Optional, Tuple
+
+import tensorflow as tf
+from tensorflow import keras
+
+
+def conv_tower_layers() -> List[keras.layers.Layer]:
+    """Return new layers of the Conv2D stack of the operational model, mapping a batch of holograms to their
+    (13, 13, 256) feature maps."""
+
+    return [
+        keras.layers.Conv2D(64, (5,5), padding='same', activation='relu'),
+        keras.layers.Conv2D(64, (5,5), padding='same', activation='relu'),
+        keras.layers.MaxPool2D(2, strides=(2,2),padding='same'),
+        keras.layers.Dropout(0.2),
+        keras.layers.Conv2D(64, (3,3), padding='same', activation='relu'),
+        keras.layers.Conv2D(64, (3,3), padding='same', activation='relu'),
+        keras.layers.MaxPool2D(2, strides=(2,2),padding='same'),
+        keras.layers.Dropout(0.2),
+        keras.layers.Conv2D(128, (3,3), padding='same', activation='relu'),
+        keras.layers.Conv2D(128, (3,3), padding='same', activation='relu'),
+        keras.layers.Conv2D(128, (3,3), padding='same', activation='relu'),
+        keras.layers.MaxPool2D((2,2), strides=(2,2),padding='same'),
+        keras.layers.Dropout(0.2),
+        keras.layers.Conv2D(256, (3,3), padding='same', activation='relu'),
+        keras.layers.Conv2D(256, (3,3), padding='same', activation='relu'),
+        keras.layers.Conv2D(256, (3,3), padding='same', activation='relu'),
+        keras.layers.MaxPool2D((2,2), strides=(2,2),padding='same'),
+        keras.layers.Dropout(0.2),
+    ]
+
+
+def conv_tower(img_shape: Tuple[int, int, int] = (200, 200, 1), name: str = 'conv_tower') -> keras.Sequential:
+    """Return the Conv2D stack of the operational model (one of its former `path0`/`path1`) as a single model,
+    mapping a batch of holograms to their (13, 13, 256) feature maps."""
+
+    return keras.Sequential([keras.layers.InputLayer(input_shape=img_shape)] + conv_tower_layers(), name=name)
+
+
+def shared_tower_paths(input0: tf.Tensor, input1: tf.Tensor, tower: keras.Model) -> Tuple[tf.Tensor, tf.Tensor]:
+    """Return the features (path0, path1) of 'rec0' and 'rec1' computed by one shared `tower`: both inputs are
+    stacked along the batch axis, run through the tower in a single call, and split again.
+    Half the weights (and optimizer state) of two separate towers, and one kernel launch per layer instead of two."""
+
+    stacked = keras.layers.Concatenate(axis=0, name='stack_rec')([input0, input1])
+    features = tower(stacked)
+    path0, path1 = tf.split(features, 2, axis=0)
+    return path0, path1
+
+
+def build_operational_model(
+    num_classes: int,
+    model_features: List[str] = ('rec0', 'rec1'),
+    img_shape: Tuple[int, int, int] = (200, 200, 1),
+    shared_tower: bool = False,
+    hidden_units: Optional[int] = 64,
+) -> keras.Model:
+    """Return the operational model of the training notebook: a conv tower per holo image ('rec0', 'rec1'), or one
+    shared tower (see `shared_tower_paths`), the fluorescence spectra ('fl_spectra') through a dense layer, a dense
+    layer of `hidden_units` (None for none, as in the model of save_model.ipynb) and a softmax output 'target'.
+    The separate towers are built layer by layer, like the notebook's."""
+
+    inputs = []
+    paths = []
+
+    if 'rec0' in model_features and 'rec1' in model_features:
+        input0 = keras.layers.Input(shape=img_shape, name='rec0')
+        input1 = keras.layers.Input(shape=img_shape, name='rec1')
+        inputs += [input0, input1]
+        if shared_tower:
+            path0, path1 = shared_tower_paths(input0, input1, conv_tower(img_shape))
+        else:
+            path0, path1 = input0, input1
+            for layer in conv_tower_layers():
+                path0 = layer(path0)
+            for layer in conv_tower_layers():
+                path1 = layer(path1)
+        holo_path = keras.layers.Concatenate()([path0, path1])
+        paths.append(keras.layers.Flatten()(holo_path))
+
+    if 'fl_spectra' in model_features:
+        input_fl = keras.layers.Input(shape=[13], name='fl_spectra')
+        inputs.append(input_fl)
+        paths.append(keras.layers.Dense(255)(input_fl * 255))
+
+    path = keras.layers.Concatenate()(paths) if len(paths) > 1 else paths[0]
+    if hidden_units is not None:
+        path = keras.layers.Dense(hidden_units)(path)
+        path = keras.layers.Dropout(0.2)(path)
+    outputs = keras.layers.Dense(num_classes, activation='softmax', name='target')(path)
+    return keras.Model(inputs=inputs, outputs=[outputs])
+
+
+def build_effnet_model(
+    num_classes: int,
+    backbone: str = 'EfficientNetB0',
+    model_features: List[str] = ('rec0', 'rec1'),
+    img_shape: Tuple[int, int, int] = (200, 200, 1),
+    fine_tune: bool = False,
+) -> keras.Model:
+    """Return the pre-trained EffNet model of the training notebook: both holo images through the ImageNet
+    pre-trained `backbone` (frozen unless `fine_tune`), the fluorescence spectra ('fl_spectra') through a dense
+    layer, and a sigmoid output 'target'."""
+
+    inputs = []
+    paths = []
+
+    if 'rec0' in model_features and 'rec1' in model_features:
+        input0 = keras.layers.Input(shape=img_shape, name='rec0')
+        input1 = keras.layers.Input(shape=img_shape, name='rec1')
+        inputs += [input0, input1]
+        net = getattr(keras.applications, backbone)(
+            input_shape=img_shape[:2] + (3,),
+            drop_connect_rate=0.4, # extra regularization in finetuning, but does not affect loaded weights
+            include_top=False,
+            weights='imagenet',
+        )
+        net.trainable = fine_tune
+        # effnet expects 3 channels in the [0, 255] data range
+        path0 = net(keras.layers.Concatenate()([input0, input0, input0]) * 255)
+        path1 = net(keras.layers.Concatenate()([input1, input1, input1]) * 255)
+        paths.append(keras.layers.Flatten()(keras.layers.Concatenate()([path0, path1])))
+
+    if 'fl_spectra' in model_features:
+        input_fl = keras.layers.Input(shape=[13], name='fl_spectra')
+        inputs.append(input_fl)
+        paths.append(keras.layers.Dense(255)(input_fl * 255))
+
+    path = keras.layers.Concatenate()(paths) if len(paths) > 1 else paths[0]
+    path = keras.layers.Dropout(.4)(path)
+    outputs = keras.layers.Dense(num_classes, activation='sigmoid', name='target')(path)
+    return keras.Model(inputs=inputs, outputs=[outputs])
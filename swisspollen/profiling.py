@@ -0,0 +1,232 @@
+"""Input pipeline profiling: throughput and latency of every stage of the input pipeline benchmarked on its own, and
+the time of the training steps compared to the time of a step on data already in memory, to tell input-bound steps
+from compute-bound ones. Written to TensorBoard and to a JSON summary."""
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from swisspollen.distribute import is_chief
+
+PERCENTILES = [50, 90, 99]
+
+
+def element_events(element, batched: bool) -> int:
+    """Return the number of events of a dataset element (the length of the batch if `batched`)."""
+
+    if not batched:
+        return 1
+    first = tf.nest.flatten(element)[0]
+    return int(first.shape[0]) if len(first.shape) > 0 else 1
+
+
+def latency_stats(latencies: np.ndarray) -> Dict[str, float]:
+    """Return the mean and percentiles of latencies given in seconds, in milliseconds."""
+
+    stats = {'mean_ms': float(np.mean(latencies) * 1e3) if len(latencies) > 0 else float('nan')}
+    for p in PERCENTILES:
+        stats[f'p{p}_ms'] = float(np.percentile(latencies, p) * 1e3) if len(latencies) > 0 else float('nan')
+    return stats
+
+
+class StepTimer(keras.callbacks.Callback):
+    """Record the duration of every training step. A step is input-bound when it takes longer than
+    `tolerance` times the step on data already in memory (`compute_time`, in seconds), i.e. it waited for its batch.
+    Written to TensorBoard at every epoch end if a `writer` is given, `on_end` is called when the training ends."""
+
+    def __init__(
+        self,
+        compute_time: Optional[float] = None,
+        tolerance: float = 1.2,
+        writer: Optional[tf.summary.SummaryWriter] = None,
+        on_end: Optional[Callable[[], None]] = None,
+    ):
+        super().__init__()
+        self.compute_time = compute_time
+        self.tolerance = tolerance
+        self.writer = writer
+        self.on_end = on_end
+        self.durations: List[float] = []
+        self._epoch_start = 0
+        self._step_start = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_start = len(self.durations)
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        # Keras waits for the step to finish before calling back callbacks that do not support tensor logs
+        self.durations.append(time.perf_counter() - self._step_start)
+
+    def input_bound(self, durations: np.ndarray) -> np.ndarray:
+        """Return whether each step of `durations` is input-bound (all False without a compute time)."""
+
+        if self.compute_time is None:
+            return np.zeros(len(durations), dtype=bool)
+        return durations > self.tolerance * self.compute_time
+
+    def summary(self, first: int = 0) -> dict:
+        """Return the statistics of the steps recorded since step `first`."""
+
+        durations = np.array(self.durations[first:])
+        summary = {'steps': len(durations), 'compute_step_ms': None, **latency_stats(durations)}
+        if self.compute_time is not None:
+            input_bound = self.input_bound(durations)
+            summary['compute_step_ms'] = self.compute_time * 1e3
+            summary['input_bound_steps'] = float(input_bound.mean()) if len(durations) > 0 else float('nan')
+            # share of the training time spent waiting for the input pipeline
+            waiting = np.maximum(durations - self.compute_time, 0.).sum()
+            summary['input_wait'] = float(waiting / durations.sum()) if len(durations) > 0 else float('nan')
+        return summary
+
+    def on_epoch_end(self, epoch, logs=None):
+        if self.writer is None or len(self.durations) == self._epoch_start:
+            return
+        durations = np.array(self.durations[self._epoch_start:])
+        summary = self.summary(self._epoch_start)
+        with self.writer.as_default():
+            tf.summary.histogram('steps/step_time_ms', durations * 1e3, step=epoch)
+            tf.summary.scalar('steps/mean_step_time_ms', summary['mean_ms'], step=epoch)
+            if self.compute_time is not None:
+                tf.summary.scalar('steps/input_bound_steps', summary['input_bound_steps'], step=epoch)
+                tf.summary.scalar('steps/input_wait', summary['input_wait'], step=epoch)
+        self.writer.flush()
+
+    def on_train_end(self, logs=None):
+        if self.on_end is not None:
+            self.on_end()
+
+
+class PipelineProfiler:
+    """Profile of an input pipeline, built stage by stage.
+
+    profiler = PipelineProfiler(logdir)
+    ds = profiler.stage('load', ds, source=True) # records the dataset at this point (tf.data datasets are immutable)
+    ds = profiler.stage('filters', ds.filter(...))
+    profiler.benchmark() # iterates every stage on its own
+    profiler.compute_step_time(model, pipeline) # step time on data already in memory
+    model.fit(pipeline, callbacks=[profiler.step_timer()])
+    profiler.save() # JSON summary, also written at the end of the training
+
+    The cost of a stage is the time per event it adds to the stage before it (a negative cost means it hides the
+    latency upstream, e.g. prefetching or parallel reads). A `source` stage starts a new chain, e.g. the cache reads
+    after the download.
+    """
+
+    SUMMARY_FILE = 'input_pipeline.json'
+
+    def __init__(self, logdir: str):
+        self.logdir = logdir
+        self.stages: Dict[str, dict] = {}
+        self.results: Dict[str, dict] = {}
+        self.compute_time = None
+        self.timer = None
+        self.writer = tf.summary.create_file_writer(logdir) if is_chief() else tf.summary.create_noop_writer()
+
+    def stage(self, name: str, tf_dataset: tf.data.Dataset, batched: bool = True, source: bool = False) -> tf.data.Dataset:
+        """Record `tf_dataset` as stage `name` (only the first dataset given for a name) and return it unchanged."""
+
+        if name not in self.stages:
+            self.stages[name] = {'dataset': tf_dataset, 'batched': batched, 'source': source}
+        return tf_dataset
+
+    def benchmark_stage(self, name: str, num_events: int = 2000, warmup: int = 10) -> dict:
+        """Iterate `warmup` elements then `num_events` events of stage `name` and return its throughput and the latency
+        of its elements (batches or events)."""
+
+        stage = self.stages[name]
+        latencies, events = [], 0
+        iterator = iter(stage['dataset'])
+        for _ in range(warmup):
+            if next(iterator, None) is None:
+                break
+        start = last = time.perf_counter()
+        while events < num_events:
+            element = next(iterator, None)
+            if element is None:
+                break
+            now = time.perf_counter()
+            latencies.append(now - last)
+            events += element_events(element, stage['batched'])
+            last = now
+        elapsed = last - start
+        latencies = np.array(latencies)
+        return {
+            'elements': len(latencies),
+            'events': events,
+            'elements_per_s': len(latencies) / elapsed if elapsed > 0 else float('nan'),
+            'events_per_s': events / elapsed if elapsed > 0 else float('nan'),
+            'ms_per_event': elapsed * 1e3 / events if events > 0 else float('nan'),
+            'latencies': latencies,
+            **latency_stats(latencies),
+        }
+
+    def benchmark(self, num_events: int = 2000, warmup: int = 10) -> Dict[str, dict]:
+        """Benchmark every stage on its own (see `benchmark_stage`), write the results to TensorBoard and return them."""
+
+        previous = None
+        for k, name in enumerate(self.stages):
+            result = self.benchmark_stage(name, num_events, warmup)
+            upstream = None if self.stages[name]['source'] or previous is None else previous['ms_per_event']
+            result['added_ms_per_event'] = result['ms_per_event'] - upstream if upstream is not None else None
+            print(
+                f"{name}: {result['events_per_s']:.1f} events/s, {result['ms_per_event']:.2f} ms/event"
+                + (f" ({result['added_ms_per_event']:+.2f} ms)" if upstream is not None else '')
+            )
+            with self.writer.as_default():
+                tf.summary.histogram(f'input/{k:02d}_{name}/latency_ms', result['latencies'] * 1e3, step=0)
+                tf.summary.scalar(f'input/{k:02d}_{name}/events_per_s', result['events_per_s'], step=0)
+            self.results[name] = result
+            previous = result
+        self.writer.flush()
+        return self.results
+
+    def compute_step_time(self, model: keras.Model, tf_dataset: tf.data.Dataset, steps: int = 20, warmup: int = 5) -> float:
+        """Return the median time (seconds) of a training step of `model` on one batch of `tf_dataset` already in
+        memory, i.e. without waiting for the input pipeline. A copy of the compiled model is trained, the model itself
+        is left untouched."""
+
+        batch = next(iter(tf_dataset))
+        clone = keras.models.clone_model(model)
+        clone.compile(optimizer=type(model.optimizer).from_config(model.optimizer.get_config()), loss=model.loss)
+        timer = StepTimer()
+        clone.fit(
+            tf.data.Dataset.from_tensors(batch).repeat(),
+            steps_per_epoch=warmup + steps,
+            epochs=1,
+            callbacks=[timer],
+            verbose=0,
+        )
+        self.compute_time = float(np.median(timer.durations[warmup:]))
+        print(f'training step on data in memory: {self.compute_time * 1e3:.1f} ms')
+        return self.compute_time
+
+    def step_timer(self, tolerance: float = 1.2) -> StepTimer:
+        """Return the callback timing the training steps (see `StepTimer`), compared to `compute_step_time`."""
+
+        self.timer = StepTimer(self.compute_time, tolerance, self.writer, on_end=self.save)
+        return self.timer
+
+    def summary(self) -> dict:
+        return {
+            'stages': {
+                name: {k: v for k, v in result.items() if k != 'latencies'}
+                for name, result in self.results.items()
+            },
+            'steps': self.timer.summary() if self.timer is not None else None,
+        }
+
+    def save(self):
+        """Write the summary to `SUMMARY_FILE` in the logdir (on the chief only)."""
+
+        if not is_chief():
+            return
+        os.makedirs(self.logdir, exist_ok=True)
+        with open(os.path.join(self.logdir, self.SUMMARY_FILE), 'w') as f:
+            f.write(json.dumps(self.summary(), indent=1))
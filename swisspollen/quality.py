@@ -0,0 +1,163 @@
+"""Per-event quality scores (blur and crop) stored once in a sidecar file, so that the data filters
+can be re-thresholded by a table lookup instead of recomputing them from the images."""
+import os
+from typing import Optional
+
+import numpy as np
+import tensorflow as tf
+
+from swisspollen.filters import crop_ratio, event_ids_of, laplacian_variance, mask_batches
+
+SCORE_FIELDS = [
+    ('blur_rec0', np.float32), # variance of the Laplacian, see filters.laplacian_variance
+    ('blur_rec1', np.float32),
+    ('crop_rec0', np.float64), # fraction of border pixels darker than BT, see filters.crop_ratio
+    ('crop_rec1', np.float64),
+]
+SCORE_NAMES = [name for name, _ in SCORE_FIELDS]
+
+
+def score_features(features: dict, BT: float = .85) -> tf.Tensor:
+    """Return the (batch, 4) float64 scores of a batch of features, in the order of SCORE_FIELDS."""
+
+    return tf.stack([
+        tf.cast(laplacian_variance(features['rec0']), tf.float64),
+        tf.cast(laplacian_variance(features['rec1']), tf.float64),
+        crop_ratio(features['rec0'], BT),
+        crop_ratio(features['rec1'], BT),
+    ], axis=1)
+
+
+def score_dataset(tf_dataset: tf.data.Dataset, BT: float = .85) -> np.ndarray:
+    """Score every event of a batched (ids, features, targets) dataset (unfiltered, before `unbatch()`)
+    and return a structured array with one record per event: event_id and SCORE_FIELDS."""
+
+    scored = tf_dataset.map(
+        lambda ids, features, targets: (event_ids_of(ids), score_features(features, BT)),
+        num_parallel_calls=tf.data.AUTOTUNE,
+    )
+    event_ids, scores = [], []
+    for ids, s in scored.as_numpy_iterator():
+        event_ids.append(ids)
+        scores.append(s)
+    event_ids = np.concatenate(event_ids).astype(bytes) if len(event_ids) > 0 else np.zeros(0, dtype='S1')
+    scores = np.concatenate(scores) if len(scores) > 0 else np.zeros((0, len(SCORE_FIELDS)))
+
+    table = np.zeros(len(event_ids), dtype=[('event_id', event_ids.dtype)] + SCORE_FIELDS)
+    table['event_id'] = event_ids
+    for k, name in enumerate(SCORE_NAMES):
+        table[name] = scores[:, k]
+    return table
+
+
+class QualityScores:
+    """Quality scores of events, stored as a NumPy structured array (`.npz`, with the `BT` they were computed with).
+
+    scores = QualityScores.load(path) (or QualityScores(score_dataset(ds), BT))
+    scores.passing(blur_T=.0014, crop_T=.0001) -> bool per event, for threshold sweeps in NumPy
+    scores.filter_batches(tf_dataset, blur_T=.0014, crop_T=.0001) -> drop the events failing the thresholds
+    """
+
+    def __init__(self, table: np.ndarray, BT: float = .85):
+        self.table = table
+        self.BT = BT
+        self._lookup = None
+
+    @classmethod
+    def load(cls, path: str) -> 'QualityScores':
+        with np.load(path) as f:
+            return cls(f['scores'], float(f['BT']))
+
+    @classmethod
+    def load_or_empty(cls, path: str, BT: float = .85) -> 'QualityScores':
+        """Load the scores at `path`, or start an empty table if there is none or if it was computed with another `BT`."""
+
+        if os.path.isfile(path):
+            scores = cls.load(path)
+            if scores.BT == BT:
+                return scores
+        return cls(np.zeros(0, dtype=[('event_id', 'S1')] + SCORE_FIELDS), BT)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, scores=self.table, BT=self.BT)
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def update(self, table: np.ndarray):
+        """Add newly scored events, replacing the scores of events already in the table."""
+
+        width = max(self.table.dtype['event_id'].itemsize, table.dtype['event_id'].itemsize)
+        dtype = [('event_id', f'S{width}')] + SCORE_FIELDS
+        merged = np.concatenate([self.table.astype(dtype), table.astype(dtype)])
+        # keep the last occurrence of every event id
+        _, last = np.unique(merged['event_id'][::-1], return_index=True)
+        self.table = merged[len(merged) - 1 - np.sort(last)[::-1]]
+        self._lookup = None
+
+    def passing(self, blur_T: Optional[float] = None, crop_T: Optional[float] = None) -> np.ndarray:
+        """Return a bool array, True for the events kept by the blur filter with threshold `blur_T` and
+        by the crop filter with threshold `crop_T` (`None` disables a filter). Same rules as filters.filter_blur
+        and filters.filter_crop."""
+
+        keep = np.ones(len(self.table), dtype=bool)
+        if blur_T is not None:
+            blur_T = np.float32(blur_T) # the blur filter compares in float32
+            keep &= ~(self.table['blur_rec0'] < blur_T) & ~(self.table['blur_rec1'] < blur_T)
+        if crop_T is not None:
+            keep &= ~(self.table['crop_rec0'] > crop_T) & ~(self.table['crop_rec1'] > crop_T)
+        return keep
+
+    def lookup_tables(self):
+        """Return the (event id -> row) hash table and the (rows + 1, 4) score matrix whose last row is NaN.
+        Built on first use, which must happen eagerly (outside of dataset functions)."""
+
+        if self._lookup is None:
+            index = tf.lookup.StaticHashTable(
+                tf.lookup.KeyValueTensorInitializer(
+                    tf.constant(self.table['event_id']),
+                    tf.range(len(self.table), dtype=tf.int64)
+                ),
+                default_value=-1
+            )
+            scores = np.stack([self.table[name].astype(np.float64) for name in SCORE_NAMES], axis=1)
+            scores = tf.constant(np.concatenate([scores, np.full((1, len(SCORE_FIELDS)), np.nan)]))
+            self._lookup = index, scores
+        return self._lookup
+
+    def lookup(self, event_ids: tf.Tensor) -> tf.Tensor:
+        """Return the (batch, 4) float64 scores of a batch of event ids, NaN for the events that are not scored."""
+
+        index, scores = self.lookup_tables()
+        rows = index.lookup(event_ids)
+        return tf.gather(scores, tf.where(rows < 0, tf.cast(len(self.table), tf.int64), rows))
+
+    def filter_batches(
+        self,
+        tf_dataset: tf.data.Dataset,
+        blur_T: Optional[float] = None,
+        crop_T: Optional[float] = None,
+    ) -> tf.data.Dataset:
+        """Keep the events of a batched (ids, features, targets) dataset that pass the thresholds (see `passing`).
+        Scores are looked up by event id; the scores of events missing from the table are computed from their images."""
+
+        self.lookup_tables()
+
+        def keep_fn(ids, features, targets):
+            scores = self.lookup(event_ids_of(ids))
+            missing = tf.reduce_any(tf.math.is_nan(scores), axis=1)
+            scores = tf.cond(
+                tf.reduce_any(missing),
+                lambda: tf.where(missing[:, None], score_features(features, self.BT), scores),
+                lambda: scores
+            )
+            keep = tf.ones_like(missing)
+            if blur_T is not None:
+                blur = tf.cast(scores[:, :2], tf.float32) # the blur filter compares in float32
+                keep = tf.logical_and(keep, tf.reduce_all(tf.logical_not(blur < blur_T), axis=1))
+            if crop_T is not None:
+                keep = tf.logical_and(keep, tf.reduce_all(tf.logical_not(scores[:, 2:] > crop_T), axis=1))
+            return keep
+
+        return mask_batches(tf_dataset, keep_fn)
@@ -0,0 +1,220 @@
+"""Resumable training: checkpoints of the model, its optimizer, the callbacks' state and the position in the
+training data, from which an interrupted `model.fit` continues mid-epoch."""
+import json
+import os
+import shutil
+from typing import Dict, List, Optional
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from swisspollen.distribute import is_chief, worker_path
+
+# attributes holding the state of the stateful Keras callbacks, restored on resume
+CALLBACK_STATE = {
+    keras.callbacks.EarlyStopping: ['wait', 'best', 'best_epoch', 'stopped_epoch'],
+    keras.callbacks.ModelCheckpoint: ['best'],
+    keras.callbacks.ReduceLROnPlateau: ['wait', 'best', 'cooldown_counter'],
+}
+
+
+class DataPosition:
+    """Epoch and batch from which the training data is read.
+
+    The shuffling order of an epoch only depends on the seed and the epoch number, and the batches already trained
+    on are skipped. Both are variables read each time Keras creates a new iterator (at every epoch), so setting them
+    before `model.fit` puts the data where an interrupted training stopped, without storing the iterator itself.
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        seed = seed if seed is not None else int(np.random.randint(2**31 - 1))
+        self.seed = tf.Variable(seed, dtype=tf.int64, trainable=False)
+        self.epoch = tf.Variable(0, dtype=tf.int64, trainable=False)
+        self.step = tf.Variable(0, dtype=tf.int64, trainable=False)
+
+    def shuffled(self, tf_dataset: tf.data.Dataset, buffer_size: int, batch_size: int) -> tf.data.Dataset:
+        """Return `tf_dataset.shuffle(buffer_size).batch(batch_size)`, shuffled by epoch and starting at the current step."""
+
+        def epoch_batches(_):
+            seed = self.seed + 1_000_003 * self.epoch
+            return tf_dataset.shuffle(buffer_size, seed=seed).batch(batch_size).skip(self.step)
+
+        return tf.data.Dataset.from_tensors(0).flat_map(epoch_batches)
+
+    def sampled(
+        self,
+        class_streams: List[tf.data.Dataset],
+        weights: List[float],
+        buffer_size: int,
+        batch_size: int,
+    ) -> tf.data.Dataset:
+        """Return endless batches of events drawn from the (unbatched) `class_streams` with probabilities `weights`,
+        every stream reshuffled at each pass over it, to train with `steps_per_epoch`.
+
+        Keras keeps the iterator of an endless dataset from one epoch to the next, so the draw only depends on the
+        seed and the epoch the training started (or resumed) at: a resumed training draws new batches with the same
+        ratios instead of replaying the interrupted ones."""
+
+        def endless_batches(_):
+            seed = self.seed + 1_000_003 * self.epoch
+            streams = [
+                stream.shuffle(buffer_size, seed=seed + k + 1).repeat()
+                for k, stream in enumerate(class_streams)
+            ]
+            return tf.data.Dataset.sample_from_datasets(streams, weights, seed=seed).batch(batch_size)
+
+        return tf.data.Dataset.from_tensors(0).flat_map(endless_batches)
+
+    def set(self, epoch: int, step: int = 0):
+        self.epoch.assign(epoch)
+        self.step.assign(step)
+
+
+class ResumableCheckpoint(keras.callbacks.Callback):
+    """Save everything needed to resume a training: weights, optimizer, callbacks' state and data position
+    (plus any other trackable, e.g. the random generator of the augmentation), at every epoch end and every
+    `save_freq` batches.
+
+    checkpoint = ResumableCheckpoint(directory, position, callbacks, save_freq=1000, augment_rng=rng)
+    if resume:
+        checkpoint.restore(model) # after compile
+    checkpoint.fit(model, train_data, epochs=epochs, callbacks=callbacks, ...) # instead of model.fit
+    """
+
+    STATE_FILE = 'state.json'
+
+    def __init__(
+        self,
+        directory: str,
+        position: DataPosition,
+        callbacks: List[keras.callbacks.Callback] = (),
+        save_freq: Optional[int] = None,
+        **trackables,
+    ):
+        super().__init__()
+        self.directory = directory
+        self.position = position
+        self.callbacks = list(callbacks)
+        self.save_freq = save_freq
+        self.trackables = trackables
+        self._manager = None
+        self._restored_callbacks = None
+        self._epoch = 0
+        self._first_step = 0
+
+    @classmethod
+    def read_state(cls, directory: str) -> Optional[dict]:
+        """Return the state of the last checkpoint in `directory`, or None if there is none."""
+
+        state_file_path = os.path.join(directory, cls.STATE_FILE)
+        if not os.path.isfile(state_file_path):
+            return None
+        with open(state_file_path, 'r') as f:
+            return json.loads(f.read())
+
+    def _checkpoint_manager(self, model: keras.Model) -> tf.train.CheckpointManager:
+        if self._manager is None:
+            checkpoint = tf.train.Checkpoint(
+                model=model,
+                optimizer=model.optimizer,
+                position_seed=self.position.seed,
+                **self.trackables
+            )
+            self._manager = tf.train.CheckpointManager(checkpoint, worker_path(self.directory), max_to_keep=2)
+        return self._manager
+
+    def _callbacks_state(self) -> Dict[str, dict]:
+        state = {}
+        for k, callback in enumerate(self.callbacks):
+            for cls, attributes in CALLBACK_STATE.items():
+                if isinstance(callback, cls):
+                    state[f'{k}:{type(callback).__name__}'] = {
+                        a: float(getattr(callback, a)) for a in attributes if hasattr(callback, a)
+                    }
+        return state
+
+    def save(self, epoch: int, step: int):
+        """Checkpoint the training at `step` batches into `epoch`. The state file is replaced last, so an interruption
+        while saving leaves the previous checkpoint usable. With several workers, all of them take part in saving the
+        distributed variables but only the chief keeps the files."""
+
+        path = self._checkpoint_manager(self.model).save()
+        if not is_chief():
+            shutil.rmtree(worker_path(self.directory), ignore_errors=True)
+            return
+        state = {
+            'checkpoint': path,
+            'epoch': epoch,
+            'step': step,
+            'callbacks': self._callbacks_state(),
+        }
+        state_file_path = os.path.join(self.directory, self.STATE_FILE)
+        with open(state_file_path + '.tmp', 'w') as f:
+            f.write(json.dumps(state, indent=1, default=str))
+        os.replace(state_file_path + '.tmp', state_file_path)
+
+    def restore(self, model: keras.Model) -> int:
+        """Restore the last checkpoint into the compiled `model` and the data position, and return the epoch the
+        training resumes at (0 if there is no checkpoint). The callbacks' state is restored when the training starts,
+        since Keras callbacks reset it in `on_train_begin`."""
+
+        state = self.read_state(self.directory)
+        if state is None:
+            return 0
+        self._checkpoint_manager(model).checkpoint.restore(state['checkpoint'])
+        self.position.set(state['epoch'], state['step'])
+        self._restored_callbacks = state['callbacks']
+        self._epoch, self._first_step = state['epoch'], state['step']
+        return state['epoch']
+
+    def fit(self, model: keras.Model, x: tf.data.Dataset, epochs: int, callbacks: List[keras.callbacks.Callback] = (), **kwargs):
+        """`model.fit(x, epochs=epochs, callbacks=callbacks + [self], **kwargs)` from the current data position.
+
+        An epoch resumed mid-way is trained by a fit call of its own: Keras infers the number of batches per epoch
+        of a dataset of unknown length from its first epoch, which would cut all the following epochs short. With
+        `steps_per_epoch`, that call trains the batches left in the epoch."""
+
+        callbacks = list(callbacks) + [self]
+        initial_epoch = int(self.position.epoch.numpy())
+        first = None
+        step = int(self.position.step.numpy())
+        if step > 0:
+            first_kwargs = dict(kwargs)
+            if kwargs.get('steps_per_epoch') is not None:
+                first_kwargs['steps_per_epoch'] = kwargs['steps_per_epoch'] - step
+            first = model.fit(x, epochs=initial_epoch + 1, initial_epoch=initial_epoch, callbacks=callbacks, **first_kwargs)
+            initial_epoch += 1
+            if model.stop_training or initial_epoch >= epochs:
+                return first
+            # fit resets the callbacks' state in on_train_begin, carry it over to the next call
+            self._restored_callbacks = self._callbacks_state()
+
+        history = model.fit(x, epochs=epochs, initial_epoch=initial_epoch, callbacks=callbacks, **kwargs)
+        if first is not None:
+            for key, values in first.history.items():
+                history.history[key] = values + history.history.get(key, [])
+            history.epoch = first.epoch + history.epoch
+        return history
+
+    def on_train_begin(self, logs=None):
+        if self._restored_callbacks is None:
+            return
+        for k, callback in enumerate(self.callbacks):
+            for attribute, value in self._restored_callbacks.get(f'{k}:{type(callback).__name__}', {}).items():
+                current = getattr(callback, attribute, None)
+                setattr(callback, attribute, int(value) if isinstance(current, int) else value)
+        self._restored_callbacks = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        if epoch != self._epoch:
+            self._epoch, self._first_step = epoch, 0
+
+    def on_train_batch_end(self, batch, logs=None):
+        if self.save_freq and (batch + 1) % self.save_freq == 0:
+            self.save(self._epoch, self._first_step + batch + 1)
+
+    def on_epoch_end(self, epoch, logs=None):
+        # the iterator of the next epoch is created after this callback: it starts at the beginning of epoch + 1
+        self.position.set(epoch + 1, 0)
+        self.save(epoch + 1, 0)
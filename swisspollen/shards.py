@@ -0,0 +1,100 @@
+"""Per-dataset cache shards: every dataset id is cached on its own, after the filters and maps, and the training and
+validation sets are composed from the shards of the chosen collections at train time. A new dataset only costs its
+own download, and collections are recombined without any."""
+import os
+import shutil
+from typing import List, Optional
+
+import tensorflow as tf
+
+from swisspollen.cache import dataset_cache_key
+from swisspollen.filters import filter_batches, filter_blur, filter_crop
+from swisspollen.maps import map_remove_waves
+from swisspollen.profiling import PipelineProfiler
+from swisspollen.quality import QualityScores
+
+# name of the shard directory in its `DatasetCache` entry
+SHARD_NAME = 'events'
+
+
+def shard_key(dataset_id: str, dataset_size: int, **description) -> str:
+    """Return the cache key of the shard of dataset `dataset_id` (see `dataset_cache_key`), e.g.
+    shard_key(dataset_id, dataset_size, model_features=..., data_filters=..., data_maps=...).
+    `dataset_size` must be a fresh count (`get_dataset_sizes` with `max_age=0`), so that a dataset whose events
+    changed gets a new shard. The classes are not part of it: the targets are set when the shards are composed."""
+    return dataset_cache_key(dataset_id=dataset_id, dataset_size=dataset_size, **description)
+
+
+def preprocess(
+    tf_dataset: tf.data.Dataset,
+    data_filters: List[str],
+    data_maps: List[str],
+    blur_T: Optional[float] = None,
+    crop_T: Optional[float] = None,
+    BT: float = .85,
+    scores: Optional[QualityScores] = None,
+    profiler: Optional[PipelineProfiler] = None,
+) -> tf.data.Dataset:
+    """Apply the filters and maps a shard is saved after to a batched (ids, features, targets) dataset loaded from
+    the database, then unbatch. `blur_T` and `crop_T` are the thresholds of the filters (None for a filter that is not
+    applied), looked up in `scores` when given. Every stage is recorded by `profiler`, if any."""
+
+    stage = profiler.stage if profiler is not None else lambda name, tf_dataset, **kwargs: tf_dataset
+    tf_dataset = stage('load', tf_dataset, source=True) # database queries and image decoding
+    if scores is not None and len(data_filters) > 0:
+        tf_dataset = scores.filter_batches(tf_dataset, blur_T=blur_T, crop_T=crop_T)
+    elif len(data_filters) > 0:
+        batch_filters = []
+        if blur_T is not None:
+            batch_filters.append(lambda features: filter_blur(features, T=blur_T))
+        if crop_T is not None:
+            batch_filters.append(lambda features: filter_crop(features, T=crop_T, BT=BT))
+        tf_dataset = filter_batches(tf_dataset, *batch_filters)
+    if len(data_filters) > 0:
+        tf_dataset = stage('filters', tf_dataset)
+    if 'process_waves' in data_maps:
+        # in order, so that a resumed training skips the same batches (see swisspollen/resume.py)
+        tf_dataset = stage('process_waves', tf_dataset.map(map_remove_waves, num_parallel_calls=tf.data.AUTOTUNE))
+    return tf_dataset.unbatch()
+
+
+def shard_exists(path: str) -> bool:
+    """Whether the shard at `path` has been fully written."""
+    return os.path.isdir(path)
+
+
+def save_shard(tf_dataset: tf.data.Dataset, path: str):
+    """Write the (unbatched) events of `tf_dataset` to the shard at `path`. The shard is written next to it and
+    renamed once complete, so an interrupted download leaves no partial shard behind."""
+
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tf.data.experimental.save(tf_dataset, tmp_path)
+    os.rename(tmp_path, path)
+
+
+def relabel(class_index: int):
+    """Return a map function setting the (sparse) targets of every event to `class_index`."""
+
+    def relabel_fn(ids, features, targets):
+        targets = tf.nest.map_structure(lambda t: tf.fill(tf.shape(t), tf.cast(class_index, t.dtype)), targets)
+        return ids, features, targets
+
+    return relabel_fn
+
+
+def interleave_shards(paths: List[str], class_indices: List[int]) -> tf.data.Dataset:
+    """Return the events of the shards at `paths`, the events of `paths[k]` labeled `class_indices[k]`, taking one
+    event from every shard in turn. Every shard is read ahead in parallel, and the order is the same at every run
+    (which resuming and sharding among workers rely on)."""
+
+    assert len(paths) > 0 and len(paths) == len(class_indices)
+    shards = [
+        tf.data.experimental.load(path).map(relabel(class_index)).prefetch(tf.data.AUTOTUNE)
+        for path, class_index in zip(paths, class_indices)
+    ]
+    return tf.data.Dataset.choose_from_datasets(
+        shards,
+        tf.data.Dataset.range(len(shards)).repeat(),
+        stop_on_empty_dataset=False, # exhausted shards are skipped, the stream ends with the last one
+    )
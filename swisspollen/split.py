@@ -0,0 +1,143 @@
+"""Deterministic train/validation split on a hash of the event ids: the side of an event only depends on its id,
+so it never changes from one run to the next, and adding events (or datasets) only adds events to both sides."""
+import os
+import uuid
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from swisspollen.filters import event_ids_of, mask_batches
+
+# events are hashed into SPLIT_BUCKETS buckets, the training set takes the first ones and the validation set the next
+SPLIT_BUCKETS = 10_000
+SIDES = ['train', 'val']
+
+
+def canonical_event_ids(event_ids: tf.Tensor) -> tf.Tensor:
+    """Return the event ids (UUID strings, with or without dashes or braces) as 32 lowercase hex digits."""
+    return tf.strings.regex_replace(tf.strings.lower(event_ids), '[-{}]', '')
+
+
+def event_buckets(event_ids: tf.Tensor) -> tf.Tensor:
+    """Return the split bucket of every event id. The hash (FarmHash Fingerprint64) is stable across runs,
+    platforms and TensorFlow versions."""
+    return tf.strings.to_hash_bucket_fast(canonical_event_ids(event_ids), SPLIT_BUCKETS)
+
+
+def split_bucket_ranges(split: Tuple[float, float]) -> Dict[str, Tuple[int, int]]:
+    """Return the [first, last) buckets of each side of the split (train_part, test_part).
+    Growing train_part only moves validation events to the training set."""
+
+    train_part, test_part = split
+    train_end = int(round(train_part * SPLIT_BUCKETS))
+    val_end = min(SPLIT_BUCKETS, int(round((train_part + test_part) * SPLIT_BUCKETS)))
+    return {'train': (0, train_end), 'val': (train_end, max(train_end, val_end))}
+
+
+def in_split(event_ids: tf.Tensor, split: Tuple[float, float], side: str) -> tf.Tensor:
+    """Return whether the events are on the `side` ('train' or 'val') of the split (train_part, test_part)."""
+
+    first, last = split_bucket_ranges(split)[side]
+    buckets = event_buckets(event_ids)
+    return tf.logical_and(buckets >= first, buckets < last)
+
+
+def split_batches(tf_dataset: tf.data.Dataset, split: Tuple[float, float], side: str) -> tf.data.Dataset:
+    """Keep the events of a batched (ids, features, targets) dataset on the `side` of the split."""
+    return mask_batches(tf_dataset, lambda ids, features, targets: in_split(event_ids_of(ids), split, side))
+
+
+def split_events(tf_dataset: tf.data.Dataset, split: Tuple[float, float], side: str) -> tf.data.Dataset:
+    """Keep the events of an unbatched (ids, features, targets) dataset on the `side` of the split."""
+    return tf_dataset.filter(lambda ids, features, targets: in_split(event_ids_of(ids), split, side))
+
+
+def fold_bucket_range(num_folds: int, fold: int) -> Tuple[int, int]:
+    """Return the [first, last) buckets of the validation events of fold `fold` of `num_folds` (k-fold
+    cross-validation: the folds' validation sets are disjoint and cover all the events)."""
+    return fold * SPLIT_BUCKETS // num_folds, (fold + 1) * SPLIT_BUCKETS // num_folds
+
+
+def in_fold(event_ids: tf.Tensor, num_folds: int, fold: int, side: str) -> tf.Tensor:
+    """Return whether the events are on the `side` ('train' or 'val') of fold `fold` of `num_folds`."""
+
+    first, last = fold_bucket_range(num_folds, fold)
+    buckets = event_buckets(event_ids)
+    in_val = tf.logical_and(buckets >= first, buckets < last)
+    return in_val if side == 'val' else tf.logical_not(in_val)
+
+
+def fold_events(tf_dataset: tf.data.Dataset, num_folds: int, fold: int, side: str) -> tf.data.Dataset:
+    """Keep the events of an unbatched (ids, features, targets) dataset on the `side` of fold `fold` of `num_folds`."""
+    return tf_dataset.filter(lambda ids, features, targets: in_fold(event_ids_of(ids), num_folds, fold, side))
+
+
+def query_bucket_counts(session, dataset_ids: Iterable[str]) -> Dict[str, np.ndarray]:
+    """Return a dict with <dataset-id>: <number of events in every split bucket>, from the event ids alone
+    (one query, no event data)."""
+    import poleno_db_interface.database.model.data_explorer_model as dem
+
+    dataset_ids = list(dataset_ids)
+    counts = {k: np.zeros(SPLIT_BUCKETS, dtype=np.int64) for k in dataset_ids}
+    if len(dataset_ids) == 0:
+        return counts
+    ids_by_bytes = {uuid.UUID(k).bytes: k for k in dataset_ids}
+
+    result = session.query(
+        dem.EventsInEventDataset.dataset_id,
+        dem.EventsInEventDataset.event_id
+    ).filter(
+        dem.EventsInEventDataset.dataset_id.in_(list(ids_by_bytes.keys()))
+    ).all()
+
+    if len(result) == 0:
+        return counts
+    datasets = np.array([ids_by_bytes[bytes(dataset_id)] for dataset_id, _ in result])
+    buckets = event_buckets(tf.constant([uuid.UUID(bytes=bytes(event_id)).hex for _, event_id in result])).numpy()
+    for k in dataset_ids:
+        counts[k] = np.bincount(buckets[datasets == k], minlength=SPLIT_BUCKETS)
+    return counts
+
+
+def get_bucket_counts(
+    session,
+    dataset_sizes: Dict[str, int],
+    cache_file_path: Optional[str] = None,
+) -> Dict[str, np.ndarray]:
+    """Return a dict with <dataset-id>: <number of events in every split bucket> (see `query_bucket_counts`).
+
+    Counts are read from the `.npz` file `cache_file_path` (kept next to the dataset sizes file) for the datasets
+    whose size in `dataset_sizes` (e.g. from `get_dataset_sizes`) is the one they were counted with, and only the
+    other datasets are queried.
+    """
+
+    cache = {}
+    if cache_file_path is not None and os.path.isfile(cache_file_path):
+        with np.load(cache_file_path) as f:
+            cache = {k: (int(size), counts) for k, size, counts in zip(f['dataset_ids'], f['sizes'], f['counts'])}
+
+    stale = [k for k, size in dataset_sizes.items() if k not in cache or cache[k][0] != size]
+    if len(stale) > 0:
+        for k, counts in query_bucket_counts(session, stale).items():
+            cache[k] = (int(counts.sum()), counts)
+        if cache_file_path is not None:
+            os.makedirs(os.path.dirname(cache_file_path) or '.', exist_ok=True)
+            dataset_ids = sorted(cache.keys())
+            np.savez(
+                cache_file_path,
+                dataset_ids=np.array(dataset_ids),
+                sizes=np.array([cache[k][0] for k in dataset_ids], dtype=np.int64),
+                counts=np.stack([cache[k][1] for k in dataset_ids]).astype(np.int32),
+            )
+
+    return {k: cache[k][1].astype(np.int64) for k in dataset_sizes}
+
+
+def get_split_sizes(bucket_counts: Dict[str, np.ndarray], split: Tuple[float, float]) -> Dict[str, Dict[str, int]]:
+    """Return a dict with <side>: {<dataset-id>: <number of events>}, for the split (train_part, test_part)."""
+
+    return {
+        side: {k: int(counts[first:last].sum()) for k, counts in bucket_counts.items()}
+        for side, (first, last) in split_bucket_ranges(split).items()
+    }
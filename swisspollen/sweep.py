@@ -0,0 +1,420 @@
+"""Headless sweeps and k-fold cross-validation: a list of training configs run back to back, in one process or on a
+pool of worker processes (one per GPU). The database is queried and the dataset shards are downloaded once, before
+the first run; the runs only read the shards, and their folds are picked by event id hash.
+
+    python -m swisspollen.sweep sweep.json [--workers 2]
+
+with sweep.json like
+{
+    "name": "lr",
+    "base": "models/real2/model/model_info.json", # a model_info.json to start from, or a dict of parameters
+    "runs": [
+        {"architecture": "effnet", "backbone": "EfficientNetB0", "learning_rate": 1e-5},
+        {"architecture": "operational", "batch_size": 16, "num_folds": 5} # one run per fold
+    ]
+}
+Every run saves its model and `model_info.json` like the training notebook (models/<name>_<k>[_fold<f>]/), and the
+results of all runs (with the mean and standard deviation over the folds) are written to models/<sweep name>_sweep.json.
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from swisspollen.cache import DatasetCache
+from swisspollen.datasets import get_class_ratios, get_class_sizes, get_dataset_mapping, get_dataset_sizes, get_sorted_class_list
+from swisspollen.losses import WeightedSCCE
+from swisspollen.maps import augment_map
+from swisspollen.metrics import ConfusionMatrix, ConfusionMatrixLogger
+from swisspollen.models import build_effnet_model, build_operational_model
+from swisspollen.quality import QualityScores
+from swisspollen.resume import DataPosition
+from swisspollen.shards import SHARD_NAME, interleave_shards, preprocess, save_shard, shard_exists, shard_key
+from swisspollen.split import fold_events, split_events
+
+# parameters of a run, same names and defaults as in the training notebook
+DEFAULTS = {
+    'DATASET_DEFINITIONS': None,
+    'collections_train': [],
+    'collections_val': [],
+    'classes': None, # all the classes of the collections
+    'train_part': 0.7,
+    'test_part': 0.3,
+    'num_folds': None, # k-fold cross-validation instead of the train_part/test_part split
+    'fold': None,
+    'model_features': ['rec0', 'rec1'],
+    'data_filters': [],
+    'filter_thresholds': {'blur': .0014, 'crop': .0001, 'crop_border': .85},
+    'data_maps': [],
+    'architecture': 'operational', # 'operational' or 'effnet'
+    'shared_tower': False,
+    'hidden_units': 64, # dense layer before the output of the operational model, None for none
+    'backbone': 'EfficientNetB0',
+    'fine_tune': False,
+    'img_shape': [200, 200, 1],
+    'batch_size': 8,
+    'epochs': 256,
+    'learning_rate': 0.000_005,
+    'patience': 5,
+    'shuffle_seed': None,
+    'balanced_sampling': False,
+    'balanced_power': 0.,
+    'steps_per_epoch': 1000,
+    'memory_cache': False, # keep the events in memory, shared by the runs on the same data (if they fit)
+}
+ARCHITECTURES = ['operational', 'effnet']
+
+
+def load_config(path: str) -> Tuple[str, List[dict]]:
+    """Return the name of the sweep and its runs: the base parameters updated with the run's, a run with
+    `num_folds` but no `fold` expanded into one run per fold."""
+
+    with open(path, 'r') as f:
+        config = json.loads(f.read())
+    name = config.get('name', os.path.splitext(os.path.basename(path))[0])
+    base = config.get('base', {})
+    if isinstance(base, str):
+        with open(base, 'r') as f:
+            base = json.loads(f.read())
+    base = {k: v for k, v in base.items() if k in DEFAULTS}
+    if 'architecture' not in base and 'backbone' in base:
+        # model_info.json written before the notebooks recorded the architecture: only the EffNet cell sets a backbone
+        base['architecture'] = 'effnet'
+
+    runs = []
+    for k, run in enumerate(config['runs']):
+        params = {**copy.deepcopy(DEFAULTS), **copy.deepcopy(base), **run} # the run's parameters override the base's
+        assert params['architecture'] in ARCHITECTURES, f'unknown architecture {params["architecture"]!r}'
+        params.setdefault('name', f'{name}_{k}')
+        folds = range(params['num_folds']) if params['num_folds'] and params['fold'] is None else [params['fold']]
+        for fold in folds:
+            runs.append(dict(
+                params,
+                fold=fold,
+                model_name=params.get('model_name', params['name'] + (f'_fold{fold}' if fold is not None else '')),
+            ))
+    return name, runs
+
+
+def filter_thresholds(params: dict) -> Tuple[Optional[float], Optional[float], float]:
+    """Return (blur_T, crop_T, BT) of a run, None for a filter that is not applied."""
+
+    thresholds = params['filter_thresholds']
+    blur_T = thresholds['blur'] if 'blur' in params['data_filters'] else None
+    crop_T = thresholds['crop'] if 'crop' in params['data_filters'] else None
+    return blur_T, crop_T, thresholds['crop_border']
+
+
+def shard_description(params: dict) -> dict:
+    """Return what the content of a dataset shard depends on, as in the training notebook (so that they share shards)."""
+
+    blur_T, crop_T, BT = filter_thresholds(params)
+    return {
+        'model_features': params['model_features'],
+        'data_filters': params['data_filters'],
+        'filter_thresholds': (blur_T, crop_T, BT if crop_T is not None else None),
+        'data_maps': [m for m in params['data_maps'] if m != 'holo_aug'], # augmentation runs after the cache
+    }
+
+
+def model_inputs(model_features: List[str]):
+    """Return a map function from (ids, features, targets) events to the (features, {'target'}) the models train on."""
+
+    def model_inputs_fn(ids, features, targets):
+        return {k: features[k] for k in model_features}, targets if isinstance(targets, dict) else {'target': targets}
+
+    return model_inputs_fn
+
+
+class SweepData:
+    """Datasets of the runs of a sweep: their dataset maps, sizes and shards, and the composed events, built once
+    and shared by all the runs on the same data."""
+
+    def __init__(self, cache_path: str = 'cache', max_bytes: Optional[int] = None):
+        self.cache = DatasetCache(os.path.join(cache_path, 'datasets'), max_bytes=max_bytes)
+        self.sizes_file_path = os.path.join(cache_path, 'dataset_sizes.json')
+        self.quality_scores_file_path = os.path.join(cache_path, 'quality_scores.npz')
+        self._sizes = {}
+        self._events = {}
+
+    def dataset_maps(self, params: dict) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """Return the {<dataset-id>: <class-label>} of the training and validation collections of a run."""
+
+        definitions = params['DATASET_DEFINITIONS']
+        classes = params['classes'] or set(
+            label for collection in params['collections_train'] + params['collections_val']
+            for label in definitions[collection].values()
+        )
+        dataset_map = get_dataset_mapping(definitions, params['collections_train'], classes)
+        dataset_map_val = get_dataset_mapping(definitions, params['collections_val'], classes)
+        assert len(dataset_map) > 0
+        return dataset_map, dataset_map_val
+
+    def sizes(self, dataset_map: Dict[str, str], session=None) -> Dict[str, int]:
+        """Return the dataset sizes. With `session`, the datasets are recounted once per sweep (the shard keys depend
+        on them), without it they are read from the sizes file written by the sweep's process with the session."""
+
+        missing = {k: v for k, v in dataset_map.items() if k not in self._sizes}
+        if len(missing) > 0:
+            self._sizes.update(get_dataset_sizes(
+                session, missing, cache_file_path=self.sizes_file_path, max_age=0. if session is not None else None,
+            ))
+        return {k: self._sizes[k] for k in dataset_map}
+
+    def shard_paths(self, params: dict, session=None) -> Dict[str, str]:
+        """Return the shard path of every dataset of a run (and mark them as used)."""
+
+        dataset_map, dataset_map_val = self.dataset_maps(params)
+        labels = dict(dataset_map, **dataset_map_val)
+        sizes = self.sizes(labels, session)
+        description = shard_description(params)
+        return {
+            dataset_id: self.cache.path(
+                shard_key(dataset_id, sizes[dataset_id], **description),
+                SHARD_NAME,
+                description=dict(description, dataset_id=dataset_id, label=label),
+            )
+            for dataset_id, label in labels.items()
+        }
+
+    def prepare(self, params: dict, query_interface_ml):
+        """Download the datasets of a run that have no shard yet."""
+
+        dataset_map, dataset_map_val = self.dataset_maps(params)
+        labels = dict(dataset_map, **dataset_map_val)
+        scores = None
+        if len(params['data_filters']) > 0 and os.path.isfile(self.quality_scores_file_path):
+            scores = QualityScores.load(self.quality_scores_file_path)
+            scores = scores if scores.BT == params['filter_thresholds']['crop_border'] else None
+        for dataset_id, path in self.shard_paths(params, query_interface_ml.session).items():
+            if shard_exists(path):
+                continue
+            print(f'downloading dataset {dataset_id} ({labels[dataset_id]})')
+            dataset = query_interface_ml.prepare_tf_dataset_from_poleno_datasets(
+                dataset_list=[dataset_id],
+                batch_size=params['batch_size'],
+                model_features=params['model_features'],
+                labels=get_sorted_class_list(labels),
+                dataset_label_mapping={dataset_id: labels[dataset_id]},
+            )
+            save_shard(preprocess(dataset.tf_dataset, params['data_filters'], params['data_maps'], *filter_thresholds(params), scores=scores), path)
+
+    def events(self, params: dict) -> Tuple[tf.data.Dataset, tf.data.Dataset, List[tf.data.Dataset]]:
+        """Return the training events, the validation events and (with balanced sampling) the training events of
+        every class of a run, from the shards."""
+
+        dataset_map, dataset_map_val = self.dataset_maps(params)
+        classes = get_sorted_class_list(dataset_map)
+        paths = self.shard_paths(params)
+
+        def compose(dataset_map_: dict) -> tf.data.Dataset:
+            key = (tuple(paths[k] for k in dataset_map_), tuple(classes), params['memory_cache'])
+            if key not in self._events:
+                events = interleave_shards([paths[k] for k in dataset_map_], [classes.index(v) for v in dataset_map_.values()])
+                self._events[key] = events.cache() if params['memory_cache'] else events
+            return self._events[key]
+
+        def side(events: tf.data.Dataset, name: str) -> tf.data.Dataset:
+            if params['fold'] is not None:
+                return fold_events(events, params['num_folds'], params['fold'], name)
+            return split_events(events, (params['train_part'], params['test_part']), name)
+
+        if len(dataset_map_val) > 0:
+            train_events, val_events = compose(dataset_map), compose(dataset_map_val)
+            class_side = lambda events: events
+        else:
+            train_events, val_events = side(compose(dataset_map), 'train'), side(compose(dataset_map), 'val')
+            class_side = lambda events: side(events, 'train')
+        class_streams = []
+        if params['balanced_sampling']:
+            for label in classes:
+                class_streams.append(class_side(compose({k: v for k, v in dataset_map.items() if v == label})))
+        return train_events, val_events, class_streams
+
+
+def build_model(params: dict, num_classes: int) -> keras.Model:
+    img_shape = tuple(params['img_shape'])
+    if params['architecture'] == 'effnet':
+        return build_effnet_model(num_classes, params['backbone'], params['model_features'], img_shape, params['fine_tune'])
+    return build_operational_model(num_classes, params['model_features'], img_shape, params['shared_tower'], params['hidden_units'])
+
+
+def train(params: dict, data: SweepData, model_path: str = 'models', sweep_name: Optional[str] = None) -> dict:
+    """Train the model of a run, save it with its `model_info.json` like the training notebook, and return its info."""
+
+    model_name = params['model_name']
+    model_info_file_path = os.path.join(model_path, model_name, 'model', 'model_info.json')
+    model_timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    checkpoint_file_path = os.path.join(model_path, model_name, 'training', 'checkpoints', model_timestamp)
+    logdir = os.path.join(model_path, model_name, 'training', 'logs', model_timestamp)
+    os.makedirs(logdir, exist_ok=True)
+
+    dataset_map, _ = data.dataset_maps(params)
+    dataset_sizes = data.sizes(dataset_map)
+    class_sizes = get_class_sizes(dataset_map, dataset_sizes)
+    classes = get_sorted_class_list(dataset_map)
+    num_classes = len(classes)
+    class_weights = sum(dataset_sizes.values()) / np.array([class_sizes[c] for c in classes])
+    class_ratios = get_class_ratios(class_sizes, classes, power=params['balanced_power'])
+
+    model_info = {
+        'model_name': model_name,
+        'model_timestamp': model_timestamp,
+        'sweep': sweep_name,
+        **{k: params[k] for k in DEFAULTS if k not in ('classes', 'filter_thresholds')},
+        'filter_thresholds': params['filter_thresholds'],
+        'classes': classes,
+        'class_weights': list(class_weights),
+    }
+    if params['balanced_sampling']:
+        model_info['class_ratios'] = list(class_ratios)
+
+    # input pipelines: the events are read from the shards, every run shuffles and batches its own
+    train_events, val_events, class_streams = data.events(params)
+    batch_size = params['batch_size']
+    position = DataPosition(seed=params['shuffle_seed'])
+    if params['balanced_sampling']:
+        train_batches = position.sampled(class_streams, class_ratios, batch_size*100, batch_size)
+    else:
+        train_batches = position.shuffled(train_events, batch_size*100, batch_size)
+    if 'holo_aug' in params['data_maps']:
+        augment_rng = tf.random.Generator.from_non_deterministic_state()
+        train_batches = train_batches.map(augment_map(rng=augment_rng), num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+    to_inputs = model_inputs(params['model_features'])
+    train_pipeline = train_batches.map(to_inputs).prefetch(tf.data.AUTOTUNE)
+    val_pipeline = val_events.batch(batch_size).map(to_inputs).prefetch(tf.data.AUTOTUNE)
+
+    model = build_model(params, num_classes)
+    confusion_matrix = ConfusionMatrix(num_classes)
+    model.compile(
+        optimizer=keras.optimizers.Adam(params['learning_rate']),
+        loss=WeightedSCCE(None if params['balanced_sampling'] else class_weights),
+        metrics=[keras.metrics.SparseCategoricalAccuracy(), confusion_matrix],
+    )
+    history = model.fit(
+        train_pipeline,
+        epochs=params['epochs'],
+        steps_per_epoch=params['steps_per_epoch'] if params['balanced_sampling'] else None,
+        validation_data=val_pipeline,
+        callbacks=[
+            keras.callbacks.EarlyStopping(monitor='val_loss', patience=params['patience']),
+            keras.callbacks.ModelCheckpoint(filepath=checkpoint_file_path, save_weights_only=True, save_best_only=True, monitor='val_loss', mode='min'),
+            keras.callbacks.TensorBoard(logdir),
+            ConfusionMatrixLogger(confusion_matrix, logdir + '/cm', class_names=classes),
+        ],
+        verbose=2,
+    )
+
+    # the best epoch's weights are the ones to export
+    model.load_weights(checkpoint_file_path)
+    model.save(os.path.join(model_path, model_name, 'model'))
+    best = int(np.argmin(history.history['val_loss']))
+    model_info['results'] = {
+        'epochs': len(history.epoch),
+        'best_epoch': best,
+        **{k: float(v[best]) for k, v in history.history.items() if k.startswith('val_')},
+    }
+    with open(model_info_file_path, 'w') as f:
+        f.write(json.dumps(model_info))
+    return model_info
+
+
+def read_model_info(params: dict, model_path: str = 'models') -> Optional[dict]:
+    model_info_file_path = os.path.join(model_path, params['model_name'], 'model', 'model_info.json')
+    if not os.path.isfile(model_info_file_path):
+        return None
+    with open(model_info_file_path, 'r') as f:
+        return json.loads(f.read())
+
+
+def summarize(runs: List[dict], model_path: str = 'models') -> dict:
+    """Return the results of the finished runs, and their mean and standard deviation over the folds of each run."""
+
+    results = {}
+    for params in runs:
+        model_info = read_model_info(params, model_path)
+        if model_info is not None and 'results' in model_info:
+            results.setdefault(params['name'], {})[params['model_name']] = model_info['results']
+    folds = {}
+    for name, by_model in results.items():
+        if len(by_model) < 2:
+            continue
+        metrics = set.intersection(*(set(r) for r in by_model.values()))
+        folds[name] = {
+            m: {'mean': float(np.mean([r[m] for r in by_model.values()])), 'std': float(np.std([r[m] for r in by_model.values()]))}
+            for m in sorted(metrics) if m.startswith('val_')
+        }
+    return {'runs': results, 'folds': folds}
+
+
+def connect(mylogin_path: str):
+    """Return the `QueryInterfaceML` connected with the MySQL login file, as in the notebooks."""
+    import myloginpath
+    from poleno_ml.database.query_interface_ml import QueryInterfaceML
+
+    return QueryInterfaceML(**myloginpath.parse('client', path=mylogin_path))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('config', help='sweep config (JSON)')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes, one per GPU, each running every n-th run')
+    parser.add_argument('--worker', type=int, default=None, help=argparse.SUPPRESS) # index of a worker process
+    parser.add_argument('--model-path', default='models')
+    parser.add_argument('--cache-path', default='cache')
+    parser.add_argument('--mylogin', default='/tf/.mylogin.cnf', help='MySQL login file')
+    parser.add_argument('--rerun', action='store_true', help='train the runs that already have a model_info.json again')
+    args = parser.parse_args(argv)
+
+    for gpu in tf.config.list_physical_devices('GPU'):
+        tf.config.experimental.set_memory_growth(gpu, True)
+    name, runs = load_config(args.config)
+    data = SweepData(args.cache_path)
+
+    if args.worker is None:
+        # everything that needs the database, once: dataset sizes and shards of all the runs
+        query_interface_ml = connect(args.mylogin)
+        for params in runs:
+            data.prepare(params, query_interface_ml)
+
+    todo = [
+        params for params in runs[(args.worker or 0)::args.workers if args.worker is not None else 1]
+        if args.rerun or read_model_info(params, args.model_path) is None
+    ]
+    if args.worker is None and args.workers > 1:
+        visible = os.environ.get('CUDA_VISIBLE_DEVICES')
+        gpus = visible.split(',') if visible else [str(k) for k in range(len(tf.config.list_physical_devices('GPU')))]
+        workers = []
+        for k in range(args.workers):
+            env = dict(os.environ, **({'CUDA_VISIBLE_DEVICES': gpus[k % len(gpus)]} if len(gpus) > 0 else {}))
+            workers.append(subprocess.Popen(
+                [sys.executable, '-m', 'swisspollen.sweep', args.config, '--workers', str(args.workers), '--worker', str(k),
+                 '--model-path', args.model_path, '--cache-path', args.cache_path] + (['--rerun'] if args.rerun else []),
+                env=env,
+            ))
+        failed = [k for k, worker in enumerate(workers) if worker.wait() != 0]
+        if len(failed) > 0:
+            print(f'workers {failed} failed')
+    else:
+        for k, params in enumerate(todo):
+            print(f'run {k + 1}/{len(todo)}: {params["model_name"]}')
+            train(params, data, args.model_path, sweep_name=name)
+            keras.backend.clear_session()
+
+    if args.worker is None:
+        summary_file_path = os.path.join(args.model_path, f'{name}_sweep.json')
+        with open(summary_file_path, 'w') as f:
+            f.write(json.dumps(summarize(runs, args.model_path), indent=1))
+        print(f'results: {summary_file_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+"""Synthetic holograms for the tests: a dark particle with rings around it, on a bright noisy background."""
+import numpy as np
+
+
+def holograms(num: int, height: int = 200, width: int = 200, seed: int = 0) -> np.ndarray:
+    """Return (num, height, width, 1) float32 images in [0, 1]."""
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:height, :width].astype(np.float32)
+    images = np.empty((num, height, width, 1), dtype=np.float32)
+    for k in range(num):
+        cy, cx = rng.uniform(.3, .7, 2) * (height, width)
+        r = np.hypot(y - cy, x - cx)
+        radius = rng.uniform(5., 30.)
+        image = .85 + .1 * np.cos(r / rng.uniform(2., 6.)) * np.exp(-r / (4 * radius))
+        image = np.where(r < radius, rng.uniform(.1, .5), image)
+        image = image + rng.normal(0., rng.uniform(.001, .05), image.shape)
+        images[k, :, :, 0] = np.clip(image, 0., 1.)
+    return images
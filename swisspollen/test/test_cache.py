@@ -0,0 +1,82 @@
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from swisspollen.cache import DatasetCache, dataset_cache_key
+
+
+class Test_DatasetCache(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = DatasetCache(self.root, max_bytes=2500)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def write_entry(self, key, last_used, num_bytes=1000):
+        path = self.cache.path(key, 'data')
+        with open(path, 'wb') as f:
+            f.write(b'\0' * num_bytes)
+        # set the time the entry was last used explicitly, so that the order does not depend on the clock
+        with open(os.path.join(self.cache.entry_path(key), DatasetCache.INFO_FILE), 'w') as f:
+            f.write('{"last_used": %f}' % last_used)
+
+    def test_key_order(self):
+        self.assertEqual(dataset_cache_key(a=1, b=[2, 3]), dataset_cache_key(b=[2, 3], a=1))
+        self.assertNotEqual(dataset_cache_key(a=1), dataset_cache_key(a=2))
+
+    def test_evict_least_recently_used(self):
+        self.write_entry('old', 1.)
+        self.write_entry('new', 3.)
+        self.write_entry('mid', 2.)
+
+        evicted = self.cache.evict()
+
+        self.assertEqual(list(evicted.keys()), ['old'])
+        self.assertEqual(self.cache.keys(), ['mid', 'new'])
+
+    def test_evict_until_it_fits(self):
+        self.cache.max_bytes = 1500
+        for k, key in enumerate(['a', 'b', 'c', 'd']):
+            self.write_entry(key, float(k))
+
+        evicted = self.cache.evict()
+
+        self.assertEqual(list(evicted.keys()), ['a', 'b', 'c'])
+        self.assertEqual(self.cache.keys(), ['d'])
+
+    def test_evict_keep(self):
+        self.write_entry('old', 1.)
+        self.write_entry('new', 3.)
+        self.write_entry('mid', 2.)
+
+        evicted = self.cache.evict(keep=['old'])
+
+        self.assertEqual(list(evicted.keys()), ['mid'])
+        self.assertEqual(self.cache.keys(), ['new', 'old'])
+
+    def test_touch_protects(self):
+        self.write_entry('a', 1.)
+        self.write_entry('b', 2.)
+        self.write_entry('c', 3.)
+        self.cache.touch('a') # now the most recently used
+
+        self.cache.evict()
+
+        self.assertEqual(self.cache.keys(), ['a', 'c'])
+
+    def test_no_limit(self):
+        self.cache.max_bytes = None
+        for k, key in enumerate(['a', 'b', 'c', 'd']):
+            self.write_entry(key, float(k))
+
+        self.assertEqual(self.cache.evict(), {})
+        self.assertEqual(len(self.cache.keys()), 4)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,57 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from swisspollen.datasets import DATASET_SIZES_MAX_AGE, get_dataset_sizes
+
+
+class Test_GetDatasetSizes(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'dataset_sizes.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def write_cache(self, age):
+        cached_at = time.time() - age
+        with open(self.path, 'w') as f:
+            f.write(json.dumps({'a': {'size': 3, 'cached_at': cached_at}, 'b': {'size': 5, 'cached_at': cached_at}}))
+
+    def test_default_reads_the_file(self):
+        self.write_cache(age=60.)
+
+        # without a session, counting any dataset would raise
+        sizes = get_dataset_sizes(None, {'a': 'x', 'b': 'y'}, cache_file_path=self.path)
+
+        self.assertEqual(sizes, {'a': 3, 'b': 5})
+
+    def test_expired(self):
+        self.write_cache(age=DATASET_SIZES_MAX_AGE + 60.)
+
+        with self.assertRaises(ValueError):
+            get_dataset_sizes(None, {'a': 'x'}, cache_file_path=self.path)
+        self.assertEqual(get_dataset_sizes(None, {'a': 'x'}, cache_file_path=self.path, max_age=None), {'a': 3})
+
+    def test_recount(self):
+        self.write_cache(age=60.)
+
+        with self.assertRaises(ValueError):
+            get_dataset_sizes(None, {'a': 'x'}, cache_file_path=self.path, max_age=0.)
+        with self.assertRaises(ValueError):
+            get_dataset_sizes(None, {'a': 'x'}, cache_file_path=self.path, refresh=True)
+
+    def test_missing(self):
+        self.write_cache(age=60.)
+
+        with self.assertRaises(ValueError):
+            get_dataset_sizes(None, {'a': 'x', 'c': 'z'}, cache_file_path=self.path, max_age=None)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,86 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+import tensorflow as tf
+
+from swisspollen.distribute import get_strategy, is_chief, logical_cpus, shard_by_data, worker_path
+
+# the logical devices must be set up before TensorFlow initializes its devices, i.e. before any test runs
+try:
+    logical_cpus(2)
+except RuntimeError:
+    pass # already initialized by a test module imported before this one
+
+
+def tf_config(task_type: str, index: int, cluster: dict) -> dict:
+    return {'TF_CONFIG': json.dumps({'cluster': cluster, 'task': {'type': task_type, 'index': index}})}
+
+
+class Test_Strategy(unittest.TestCase):
+
+    def test_mirrored(self):
+        if len(tf.config.list_logical_devices('CPU')) != 2:
+            self.skipTest('TensorFlow initialized its devices before the CPU could be split')
+
+        strategy = get_strategy('mirrored')
+
+        self.assertIsInstance(strategy, tf.distribute.MirroredStrategy)
+        self.assertEqual(strategy.num_replicas_in_sync, 2)
+        # every replica gets its share of a global batch
+        dataset = strategy.experimental_distribute_dataset(tf.data.Dataset.range(8).batch(4))
+        total = sum(
+            float(strategy.reduce(tf.distribute.ReduceOp.SUM, strategy.run(lambda x: tf.reduce_sum(tf.cast(x, tf.float32)), args=(batch,)), axis=None))
+            for batch in dataset
+        )
+        self.assertEqual(total, float(sum(range(8))))
+
+    def test_one_device(self):
+        strategy = get_strategy('one_device')
+
+        self.assertIsInstance(strategy, tf.distribute.OneDeviceStrategy)
+        self.assertEqual(strategy.num_replicas_in_sync, 1)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            get_strategy('parameter_server')
+
+    def test_shard_by_data(self):
+        dataset = shard_by_data(tf.data.Dataset.range(8))
+
+        self.assertEqual(dataset.options().experimental_distribute.auto_shard_policy, tf.data.experimental.AutoShardPolicy.DATA)
+        self.assertEqual(list(dataset.as_numpy_iterator()), list(range(8)))
+
+
+class Test_Workers(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join('models', 'real2', 'training', 'resume')
+
+    def test_no_cluster(self):
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertTrue(is_chief())
+            self.assertEqual(worker_path(self.path), self.path)
+
+    def test_single_worker(self):
+        with mock.patch.dict(os.environ, tf_config('worker', 0, {'worker': ['localhost:12345']})):
+            self.assertTrue(is_chief())
+            self.assertEqual(worker_path(self.path), self.path)
+
+    def test_other_worker(self):
+        with mock.patch.dict(os.environ, tf_config('worker', 1, {'worker': ['localhost:12345', 'localhost:12346']})):
+            self.assertFalse(is_chief())
+            self.assertEqual(worker_path(self.path + os.sep), os.path.join('models', 'real2', 'training', 'workertemp_worker_1_resume'))
+
+    def test_chief_task(self):
+        cluster = {'chief': ['localhost:12345'], 'worker': ['localhost:12346']}
+        with mock.patch.dict(os.environ, tf_config('chief', 0, cluster)):
+            self.assertTrue(is_chief())
+        with mock.patch.dict(os.environ, tf_config('worker', 0, cluster)):
+            self.assertFalse(is_chief())
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from swisspollen.embeddings import Embeddings, compute_embeddings, data_path
+from swisspollen.resume import DataPosition
+
+
+def embedder(img_shape=(8, 8, 1), dim=4) -> keras.Model:
+    image = keras.layers.Input(shape=img_shape)
+    embedding = keras.layers.Dense(dim)(keras.layers.Flatten()(image))
+    return keras.Model(inputs=image, outputs=embedding)
+
+
+class Test_Embeddings(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'embeddings_train')
+        self.embedder = embedder()
+
+        rng = np.random.default_rng(0)
+        self.rec0 = rng.uniform(size=(20, 8, 8, 1)).astype(np.float32)
+        self.rec1 = rng.uniform(size=(20, 8, 8, 1)).astype(np.float32)
+        self.targets = np.arange(20) % 3
+        pipeline = tf.data.Dataset.from_tensor_slices(
+            ({'rec0': self.rec0, 'rec1': self.rec1}, {'target': self.targets})
+        ).batch(6)
+        self.embeddings = compute_embeddings(self.embedder, pipeline, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def expected(self) -> np.ndarray:
+        return np.stack([self.embedder(self.rec0).numpy(), self.embedder(self.rec1).numpy()], axis=1).astype(np.float16)
+
+    def test_round_trip(self):
+        self.assertTrue(Embeddings.exists(self.path))
+        self.assertEqual(os.path.getsize(data_path(self.path)), 20 * 2 * 4 * 2) # float16
+
+        embeddings = Embeddings(self.path)
+
+        self.assertEqual(len(embeddings), 20)
+        self.assertEqual(embeddings.data.dtype, np.float16)
+        np.testing.assert_array_equal(embeddings.data, self.expected())
+        np.testing.assert_array_equal(embeddings.targets, self.targets)
+
+    def test_dataset(self):
+        batches = list(self.embeddings.dataset(6).as_numpy_iterator())
+
+        self.assertEqual([len(labels['target']) for _, labels in batches], [6, 6, 6, 2])
+        rec0 = np.concatenate([features['rec0'] for features, _ in batches])
+        targets = np.concatenate([labels['target'] for _, labels in batches])
+        np.testing.assert_array_equal(rec0, self.expected()[:, 0].astype(np.float32))
+        np.testing.assert_array_equal(targets, self.targets)
+
+    def assert_aligned(self, batches):
+        # every embedding comes with the target of its event, whatever order it is drawn in
+        expected = self.expected()[:, 1].astype(np.float32)
+        for features, labels in batches:
+            for rec1, target in zip(features['rec1'], labels['target']):
+                index = int(np.flatnonzero((expected == rec1).all(axis=1))[0])
+                self.assertEqual(target, self.targets[index])
+
+    def test_dataset_position(self):
+        position = DataPosition(seed=1)
+        pipeline = self.embeddings.dataset(6, position=position)
+        epoch = list(pipeline.as_numpy_iterator())
+
+        targets = np.concatenate([labels['target'] for _, labels in epoch])
+        self.assertEqual(sorted(targets.tolist()), sorted(self.targets.tolist()))
+        self.assert_aligned(epoch)
+
+        # resumed mid-epoch: the same batches, the first ones skipped
+        position.set(0, 2)
+        resumed = list(pipeline.as_numpy_iterator())
+        self.assertEqual(len(resumed), len(epoch) - 2)
+        for (features, _), (expected, _) in zip(resumed, epoch[2:]):
+            self.assertEqual(sorted(features['rec0'][:, 0].tolist()), sorted(expected['rec0'][:, 0].tolist()))
+
+    def test_dataset_class_ratios(self):
+        position = DataPosition(seed=1)
+        batches = list(self.embeddings.dataset(6, position=position, class_ratios=[.5, .5, 0.]).take(10).as_numpy_iterator())
+
+        targets = np.concatenate([labels['target'] for _, labels in batches])
+        self.assertEqual(len(targets), 60) # endless batches
+        self.assertEqual(set(targets.tolist()), {0, 1})
+        self.assert_aligned(batches)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,93 @@
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from swisspollen import export
+from swisspollen.export import FrozenModule, FrozenPredictor, GraphPredictor, KerasPredictor, Predictor, ServingModule, freeze, input_mapping
+
+
+def small_model(input_names=('rec0', 'rec1'), num_classes=3) -> keras.Model:
+    inputs = [keras.layers.Input(shape=[8, 8, 1], name=name) for name in input_names]
+    path = keras.layers.Flatten()(keras.layers.Concatenate()(inputs))
+    path = keras.layers.Dropout(.5)(keras.layers.Dense(16, activation='relu')(path))
+    outputs = keras.layers.Dense(num_classes, activation='softmax', name='target')(path)
+    return keras.Model(inputs=inputs, outputs=[outputs])
+
+
+class Test_Predictor(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.features = {
+            'rec0': rng.uniform(size=(50, 8, 8, 1)).astype(np.float32),
+            'rec1': rng.uniform(size=(50, 8, 8, 1)).astype(np.float32),
+            'fl_spectra': rng.uniform(size=(50, 13)).astype(np.float32),
+        }
+
+    def test_abstract(self):
+        self.assertRaises(TypeError, Predictor)
+
+    def test_keras(self):
+        model = small_model()
+        predictor = KerasPredictor(model, batch_size=16)
+        expected = model.predict({k: self.features[k] for k in ['rec0', 'rec1']}, verbose=False)
+        np.testing.assert_allclose(predictor.predict(self.features), expected, rtol=1e-5, atol=1e-6)
+
+        class_index, certainty = predictor.classifier(self.features.keys())(self.features)
+        np.testing.assert_array_equal(class_index, np.argmax(expected, axis=-1))
+        np.testing.assert_allclose(certainty, np.max(expected, axis=-1), rtol=1e-5)
+
+    def test_legacy_inputs(self):
+        self.assertEqual(input_mapping(['input_1', 'input_2'], ['rec0', 'rec1']), {'input_1': 'rec0', 'input_2': 'rec1'})
+        model = small_model(('input_1', 'input_2'))
+        expected = model.predict([self.features['rec0'], self.features['rec1']], verbose=False)
+        np.testing.assert_allclose(KerasPredictor(model).predict(self.features), expected, rtol=1e-5, atol=1e-6)
+
+    def test_frozen(self):
+        model = small_model()
+        module = freeze(model)
+        specs = module.serve.input_signature[0]
+        predictor = GraphPredictor(lambda inputs: module.serve(inputs)['target'], specs, batch_size=16)
+        expected = KerasPredictor(model).predict(self.features)
+        np.testing.assert_allclose(predictor.predict(self.features), expected, rtol=1e-5, atol=1e-6)
+
+    def test_freezing_supported(self):
+        # fails on a TensorFlow outside the tested range: check freeze with it, then extend FREEZE_TF_VERSIONS
+        oldest, newest = export.FREEZE_TF_VERSIONS
+        self.assertTrue(oldest <= export.tf_version() <= newest)
+        self.assertTrue(export.freezing_supported())
+
+        module = freeze(small_model())
+
+        self.assertIsInstance(module, FrozenModule)
+        self.assertEqual(len(module.trainable_variables), 0) # the weights are constants
+
+    def test_unsupported_version(self):
+        model = small_model()
+        expected = KerasPredictor(model).predict(self.features)
+        root = tempfile.mkdtemp()
+        try:
+            with mock.patch.object(tf, '__version__', '2.99.0'):
+                self.assertFalse(export.freezing_supported())
+                module = freeze(model)
+            self.assertIsInstance(module, ServingModule)
+
+            # saved and loaded as the frozen artifact, without Keras
+            path = os.path.join(root, 'frozen')
+            tf.saved_model.save(module, path, signatures={'serving_default': module.serve})
+            predictor = FrozenPredictor(path, batch_size=16)
+            np.testing.assert_allclose(predictor.predict(self.features), expected, rtol=1e-5, atol=1e-6)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,38 @@
+
+import unittest
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from swisspollen.filters import filter_blur, laplacian_variance, reflect_pad
+from swisspollen.test.holograms import holograms
+
+
+class Test_Filters(unittest.TestCase):
+
+    def setUp(self):
+        self.images = holograms(8)
+
+    def test_reflect_pad(self):
+        padded = reflect_pad(tf.constant(self.images), 2).numpy()
+        for image, expected in zip(padded, self.images):
+            expected = cv2.copyMakeBorder(expected[:, :, 0], 2, 2, 2, 2, cv2.BORDER_REFLECT_101)
+            np.testing.assert_array_equal(image[:, :, 0], expected)
+
+    def test_laplacian_variance(self):
+        variances = laplacian_variance(tf.constant(self.images)).numpy()
+        expected = [cv2.Laplacian(image[:, :, 0], cv2.CV_32F).var() for image in self.images]
+        np.testing.assert_allclose(variances, expected, rtol=1e-4)
+
+    def test_filter_blur(self):
+        variances = np.array([cv2.Laplacian(image[:, :, 0], cv2.CV_32F).var() for image in self.images])
+        T = float(np.median(variances)) # half of the events are blurry
+        features = {'rec0': tf.constant(self.images), 'rec1': tf.constant(self.images[::-1])}
+        expected = np.logical_and(variances >= T, variances[::-1] >= T)
+        np.testing.assert_array_equal(filter_blur(features, T).numpy(), expected)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,64 @@
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from swisspollen.inference import PredictionColumns
+
+
+class Test_PredictionColumns(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.num = 37
+        self.event_ids = np.array([f'{k:08x}-0000-0000-0000-000000000000'.encode() for k in range(self.num)], dtype=object)
+        self.class_index = rng.integers(0, 3, self.num).astype(np.int32)
+        self.certainty = rng.uniform(size=self.num).astype(np.float32)
+        self.timestamps = 1.6e9 + np.arange(self.num, dtype=np.float64)
+
+    def append(self, columns, batch_size):
+        for first in range(0, self.num, batch_size):
+            last = first + batch_size
+            columns.append(self.event_ids[first:last], self.class_index[first:last], self.certainty[first:last], self.timestamps[first:last])
+
+    def test_grow(self):
+        columns = PredictionColumns(capacity=4)
+        self.append(columns, 5) # the first batch is already larger than the capacity
+
+        self.assertEqual(columns.size, self.num)
+        self.assertGreaterEqual(len(columns.class_index), self.num)
+        for name in ['event_id', 'class_index', 'certainty', 'timestamp']:
+            self.assertEqual(len(getattr(columns, name)), len(columns.class_index))
+        np.testing.assert_array_equal(columns.event_id[:self.num], self.event_ids.astype(bytes))
+        np.testing.assert_array_equal(columns.class_index[:self.num], self.class_index)
+        np.testing.assert_array_equal(columns.certainty[:self.num], self.certainty)
+        np.testing.assert_array_equal(columns.timestamp[:self.num], self.timestamps)
+
+    def test_doubling(self):
+        columns = PredictionColumns(capacity=16)
+        self.append(columns, 1)
+        self.assertEqual(len(columns.class_index), 64) # 16 -> 32 -> 64, not one reallocation per batch
+
+    def test_long_ids(self):
+        columns = PredictionColumns(capacity=8, id_width=4)
+        self.append(columns, 8)
+        np.testing.assert_array_equal(columns.event_id[:self.num], self.event_ids.astype(bytes)) # never truncated
+
+    def test_dataframe(self):
+        columns = PredictionColumns(capacity=8)
+        self.append(columns, 8)
+        classes = ['a', 'b', 'c']
+        df = columns.dataframe(classes)
+
+        self.assertEqual(list(df.columns), ['event_id', 'pred_class', 'pred_certainty'])
+        self.assertEqual(len(df), self.num)
+        self.assertEqual(list(df['event_id']), [i.decode() for i in self.event_ids])
+        self.assertEqual(list(df['pred_class']), [classes[k] for k in self.class_index])
+        self.assertEqual(df.index.name, 'event_timestamp')
+        self.assertEqual(df.index[0], pd.to_datetime(self.timestamps[0], unit='s'))
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
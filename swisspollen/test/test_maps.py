@@ -0,0 +1,110 @@
+
+import unittest
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from swisspollen.maps import augment, augment_map, gaussian_blur_5x5, otsu_threshold, random_rotate, remove_waves, to_uint8_levels
+from swisspollen.test.holograms import holograms
+
+
+def rmv_waves(image: np.ndarray) -> np.ndarray:
+    """The former OpenCV map of the training notebooks, for one (height, width, 1) image."""
+
+    img = (image*255).astype(np.uint8)
+    img = img.reshape(*img.shape[:-1])
+    blurred = cv2.GaussianBlur(img, (5, 5), 0)
+    _, mask = cv2.threshold(blurred, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    cleaned = img * ~(mask).astype(bool)
+    return cleaned
+
+
+class Test_Maps(unittest.TestCase):
+
+    def setUp(self):
+        self.images = holograms(8)
+        self.levels = (self.images * 255).astype(np.uint8)
+
+    def test_to_uint8_levels(self):
+        levels = to_uint8_levels(tf.constant(self.images)).numpy()
+        np.testing.assert_array_equal(levels, self.levels)
+
+    def test_gaussian_blur(self):
+        blurred = gaussian_blur_5x5(tf.constant(self.levels, dtype=tf.float32)).numpy()
+        for image, levels in zip(blurred, self.levels):
+            np.testing.assert_array_equal(image[:, :, 0], cv2.GaussianBlur(levels[:, :, 0], (5, 5), 0))
+
+    def test_otsu_threshold(self):
+        thresholds = otsu_threshold(tf.constant(self.levels, dtype=tf.float32)).numpy()
+        expected = [cv2.threshold(levels[:, :, 0], 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[0] for levels in self.levels]
+        np.testing.assert_array_equal(thresholds, expected)
+
+    def test_remove_waves(self):
+        cleaned = remove_waves(tf.constant(self.images)).numpy()
+        self.assertEqual(cleaned.dtype, np.float32)
+        for image, expected in zip(cleaned, self.images):
+            np.testing.assert_array_equal(image[:, :, 0], rmv_waves(expected))
+
+    def test_remove_waves_uniform(self):
+        # a single grey level has no Otsu threshold to speak of: OpenCV returns 0 and keeps nothing
+        images = np.full((2, 16, 16, 1), .5, dtype=np.float32)
+        cleaned = remove_waves(tf.constant(images)).numpy()
+        for image, expected in zip(cleaned, images):
+            np.testing.assert_array_equal(image[:, :, 0], rmv_waves(expected))
+
+
+class Test_Augment(unittest.TestCase):
+
+    def setUp(self):
+        self.images = tf.constant(holograms(4, height=32, width=32))
+
+    def test_shape_and_dtype(self):
+        rng = tf.random.Generator.from_seed(1)
+        for augmented in [augment(self.images, rng), random_rotate(self.images, rng, max_angle=1.)]:
+            self.assertEqual(augmented.shape, self.images.shape)
+            self.assertEqual(augmented.dtype, tf.float32)
+
+    def test_rotate_zero_angle(self):
+        rotated = random_rotate(self.images, tf.random.Generator.from_seed(1), max_angle=0.)
+        np.testing.assert_array_equal(rotated.numpy(), self.images.numpy())
+
+    def test_same_seed(self):
+        first = augment(self.images, tf.random.Generator.from_seed(1))
+        second = augment(self.images, tf.random.Generator.from_seed(1))
+        np.testing.assert_array_equal(first.numpy(), second.numpy())
+
+    def test_new_draws(self):
+        rng = tf.random.Generator.from_seed(1)
+        first = augment(self.images, rng)
+        second = augment(self.images, rng)
+        self.assertFalse(np.array_equal(first.numpy(), second.numpy()))
+
+    def test_map(self):
+        ids = tf.constant(['a', 'b', 'c', 'd'])
+        features = {'rec0': self.images, 'rec1': self.images, 'other': tf.range(4)}
+        targets = tf.range(4)
+
+        out_ids, out_features, out_targets = augment_map(seed=1)(ids, features, targets)
+        again = augment_map(seed=1)(ids, features, targets)[1]
+
+        self.assertIs(out_ids, ids)
+        self.assertIs(out_targets, targets)
+        self.assertIs(out_features['other'], features['other'])
+        self.assertIs(features['rec0'], self.images) # the input features are not modified
+        np.testing.assert_array_equal(out_features['rec0'].numpy(), again['rec0'].numpy())
+        np.testing.assert_array_equal(out_features['rec1'].numpy(), again['rec1'].numpy())
+        # the two holograms of an event draw their own augmentation
+        self.assertFalse(np.array_equal(out_features['rec0'].numpy(), out_features['rec1'].numpy()))
+
+    def test_map_epochs(self):
+        # the generator lives outside the iterators: a second pass over the dataset draws new augmentations
+        dataset = tf.data.Dataset.from_tensors((tf.constant(['a']), {'rec0': self.images[:1], 'rec1': self.images[:1]}))
+        dataset = dataset.map(augment_map(seed=1))
+        first, second = [[features['rec0'].numpy() for _, features in dataset] for _ in range(2)]
+        self.assertFalse(np.array_equal(first[0], second[0]))
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,128 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from swisspollen.metrics import ConfusionMatrix, ConfusionMatrixLogger, confusion_matrix_text
+
+
+def one_hot(predicted, num_classes=3) -> np.ndarray:
+    return np.eye(num_classes, dtype=np.float32)[predicted]
+
+
+class Test_ConfusionMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        # rows: true label, columns: predicted label
+        self.cm = np.array([
+            [3, 1, 0],
+            [0, 2, 2],
+            [1, 0, 1],
+        ])
+        pairs = [(t, p) for t in range(3) for p in range(3) for _ in range(self.cm[t, p])]
+        self.labels = np.array([t for t, _ in pairs])
+        self.predicted = np.array([p for _, p in pairs])
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_accumulate(self):
+        metric = ConfusionMatrix(3)
+        # in batches, one of them empty
+        for start, end in [(0, 4), (4, 4), (4, 9), (9, 10)]:
+            metric.update_state(self.labels[start:end], one_hot(self.predicted[start:end]))
+
+        np.testing.assert_array_equal(metric.confusion_matrix().numpy(), self.cm)
+
+    def test_balanced_accuracy(self):
+        metric = ConfusionMatrix(3)
+        metric.update_state(self.labels, one_hot(self.predicted))
+
+        # recall of the classes: 3/4, 2/4 and 1/2
+        self.assertAlmostEqual(float(metric.result()), (3/4 + 2/4 + 1/2) / 3)
+
+    def test_balanced_accuracy_absent_class(self):
+        metric = ConfusionMatrix(3)
+        metric.update_state([0, 0, 1], one_hot([0, 1, 1]))
+
+        self.assertAlmostEqual(float(metric.result()), (1/2 + 1) / 2) # class 2 has no events
+
+    def test_sample_weight(self):
+        metric = ConfusionMatrix(3)
+        metric.update_state([0, 1], one_hot([0, 0]), sample_weight=[2., .5])
+
+        np.testing.assert_array_equal(metric.confusion_matrix().numpy(), [[2., 0., 0.], [.5, 0., 0.], [0., 0., 0.]])
+
+    def test_reset_state(self):
+        metric = ConfusionMatrix(3)
+        metric.update_state(self.labels, one_hot(self.predicted))
+        metric.reset_state()
+
+        np.testing.assert_array_equal(metric.confusion_matrix().numpy(), np.zeros((3, 3)))
+        self.assertEqual(float(metric.result()), 0.)
+
+    def test_config(self):
+        metric = ConfusionMatrix.from_config(ConfusionMatrix(3, name='cm').get_config())
+
+        self.assertEqual(metric.num_classes, 3)
+        self.assertEqual(metric.name, 'cm')
+
+    def test_load_model(self):
+        inputs = keras.layers.Input(shape=[3])
+        model = keras.Model(inputs=inputs, outputs=keras.layers.Lambda(lambda x: x * 1.)(inputs))
+        model.compile(loss='sparse_categorical_crossentropy', metrics=[ConfusionMatrix(3)])
+        path = os.path.join(self.root, 'model')
+        model.save(path)
+
+        loaded = keras.models.load_model(path) # without custom_objects, the metric is registered
+        results = loaded.evaluate(one_hot(self.predicted), self.labels, batch_size=4, return_dict=True, verbose=0)
+
+        self.assertAlmostEqual(results['balanced_accuracy'], (3/4 + 2/4 + 1/2) / 3, places=6)
+
+    def test_text(self):
+        text = confusion_matrix_text(self.cm, ['a', 'b', 'c'])
+
+        self.assertEqual(text.splitlines(), [
+            '| true \\ predicted | a | b | c |',
+            '|---|---|---|---|',
+            '| a | 3 | 1 | 0 |',
+            '| b | 0 | 2 | 2 |',
+            '| c | 1 | 0 | 1 |',
+        ])
+
+    def test_logger(self):
+        metric = ConfusionMatrix(3)
+        metric.update_state(self.labels, one_hot(self.predicted))
+        logdir = os.path.join(self.root, 'cm')
+        logger = ConfusionMatrixLogger(metric, logdir, class_names=['a', 'b', 'c'])
+
+        logger.on_epoch_end(0, logs={'loss': 1.}) # no validation pass: nothing is written
+        logger.on_epoch_end(1, logs={'val_balanced_accuracy': .5})
+
+        # (step, tag, plugin) of every summary written
+        summaries = {}
+        for path in glob.glob(os.path.join(logdir, 'events.out.tfevents.*')):
+            for event in tf.compat.v1.train.summary_iterator(path):
+                for value in event.summary.value:
+                    summaries[(event.step, value.tag, value.metadata.plugin_data.plugin_name)] = tf.make_ndarray(value.tensor)
+
+        self.assertEqual(sorted(summaries.keys()), [
+            (1, 'Confusion Matrix', 'images'),
+            (1, 'Confusion Matrix', 'text'),
+            (1, 'confusion_matrix', ''),
+        ])
+        np.testing.assert_array_equal(summaries[(1, 'confusion_matrix', '')], self.cm)
+        width, height, png = summaries[(1, 'Confusion Matrix', 'images')]
+        self.assertEqual((int(width), int(height)), (3 * 16, 3 * 16))
+        self.assertEqual(tf.io.decode_png(png).shape, (3 * 16, 3 * 16, 3))
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,52 @@
+import unittest
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from swisspollen.models import build_operational_model, conv_tower, shared_tower_paths
+from swisspollen.test.holograms import holograms
+
+IMG_SHAPE = (32, 32, 1)
+
+
+class Test_SharedTower(unittest.TestCase):
+
+    def setUp(self):
+        images = holograms(6, height=IMG_SHAPE[0], width=IMG_SHAPE[1])
+        self.rec0, self.rec1 = tf.constant(images[:3]), tf.constant(images[3:])
+        self.tower = conv_tower(IMG_SHAPE)
+
+    def paths_model(self) -> keras.Model:
+        input0 = keras.layers.Input(shape=IMG_SHAPE, name='rec0')
+        input1 = keras.layers.Input(shape=IMG_SHAPE, name='rec1')
+        return keras.Model(inputs=[input0, input1], outputs=shared_tower_paths(input0, input1, self.tower))
+
+    def test_paths(self):
+        path0, path1 = self.paths_model()([self.rec0, self.rec1], training=False)
+
+        self.assertEqual(path0.shape, (3, 2, 2, 256))
+        np.testing.assert_allclose(path0.numpy(), self.tower(self.rec0, training=False).numpy(), rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(path1.numpy(), self.tower(self.rec1, training=False).numpy(), rtol=1e-5, atol=1e-6)
+
+    def test_paths_keep_rec0_and_rec1_apart(self):
+        # every event of rec0 comes back in path0 and every event of rec1 in path1, in their order
+        path0, path1 = self.paths_model()([self.rec0, self.rec0[::-1]], training=False)
+
+        np.testing.assert_allclose(path1.numpy(), path0.numpy()[::-1], rtol=1e-5, atol=1e-6)
+        self.assertFalse(np.allclose(path0.numpy()[0], path0.numpy()[-1]))
+
+    def test_shared_model_parameters(self):
+        shared = build_operational_model(3, img_shape=IMG_SHAPE, shared_tower=True)
+        separate = build_operational_model(3, img_shape=IMG_SHAPE, shared_tower=False)
+
+        # the same head, on one tower instead of two
+        self.assertEqual(separate.count_params() - shared.count_params(), self.tower.count_params())
+        self.assertEqual(shared.output_shape, separate.output_shape)
+        outputs = shared({'rec0': self.rec0, 'rec1': self.rec1}, training=False)
+        self.assertEqual(outputs.shape, (3, 3))
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,88 @@
+
+import os
+import shutil
+import tempfile
+import unittest
+from functools import partial
+
+import numpy as np
+import tensorflow as tf
+
+from swisspollen.filters import filter_batches, filter_blur, filter_crop
+from swisspollen.quality import QualityScores, score_dataset
+from swisspollen.test.holograms import holograms
+
+
+def kept_ids(tf_dataset: tf.data.Dataset) -> list:
+    return [ids['id'] for ids, features, targets in tf_dataset.unbatch().as_numpy_iterator()]
+
+
+class Test_QualityScores(unittest.TestCase):
+
+    def setUp(self):
+        num = 24
+        images = holograms(2 * num, height=64, width=64)
+        self.event_ids = np.array([f'event-{k:03d}'.encode() for k in range(num)])
+        self.dataset = tf.data.Dataset.from_tensor_slices((
+            {'id': self.event_ids},
+            {'rec0': images[:num], 'rec1': images[num:]},
+            np.arange(num) % 3,
+        )).batch(5)
+        self.scores = QualityScores(score_dataset(self.dataset))
+        # thresholds that keep some of the events but not all
+        self.blur_T = float(np.median(self.scores.table['blur_rec0']))
+        self.crop_T = float(np.median(self.scores.table['crop_rec1']))
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def expected(self, blur_T, crop_T) -> list:
+        filters = []
+        if blur_T is not None:
+            filters.append(partial(filter_blur, T=blur_T))
+        if crop_T is not None:
+            filters.append(partial(filter_crop, T=crop_T, BT=self.scores.BT))
+        return kept_ids(filter_batches(self.dataset, *filters))
+
+    def test_score_dataset(self):
+        np.testing.assert_array_equal(self.scores.table['event_id'], self.event_ids)
+
+    def test_filter_batches(self):
+        for blur_T, crop_T in [(self.blur_T, None), (None, self.crop_T), (self.blur_T, self.crop_T)]:
+            expected = self.expected(blur_T, crop_T)
+            self.assertTrue(0 < len(expected) < len(self.event_ids))
+            self.assertEqual(kept_ids(self.scores.filter_batches(self.dataset, blur_T, crop_T)), expected)
+
+    def test_passing(self):
+        expected = self.expected(self.blur_T, self.crop_T)
+        passing = self.scores.passing(self.blur_T, self.crop_T)
+        self.assertEqual(list(self.scores.table['event_id'][passing]), expected)
+
+    def test_missing_events(self):
+        # events without scores are scored from their images
+        scores = QualityScores(self.scores.table[::2])
+        kept = kept_ids(scores.filter_batches(self.dataset, self.blur_T, self.crop_T))
+        self.assertEqual(kept, self.expected(self.blur_T, self.crop_T))
+
+    def test_update(self):
+        scores = QualityScores(self.scores.table[:10])
+        changed = self.scores.table[5:].copy()
+        changed['blur_rec0'] += 1.
+        scores.update(changed)
+        self.assertEqual(len(scores), len(self.event_ids))
+        np.testing.assert_array_equal(scores.table['event_id'], self.event_ids)
+        np.testing.assert_array_equal(scores.table['blur_rec0'][5:], changed['blur_rec0'])
+
+    def test_save_load(self):
+        path = os.path.join(self.root, 'quality_scores.npz')
+        self.scores.save(path)
+        loaded = QualityScores.load(path)
+        np.testing.assert_array_equal(loaded.table, self.scores.table)
+        self.assertEqual(loaded.BT, self.scores.BT)
+        self.assertEqual(len(QualityScores.load_or_empty(path, BT=.5)), 0)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,71 @@
+
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from swisspollen.resume import DataPosition
+
+
+def batches(tf_dataset: tf.data.Dataset, take: int = None) -> list:
+    if take is not None:
+        tf_dataset = tf_dataset.take(take)
+    return [batch.tolist() for batch in tf_dataset.as_numpy_iterator()]
+
+
+class Test_DataPosition(unittest.TestCase):
+
+    def setUp(self):
+        self.events = tf.data.Dataset.range(100)
+
+    def test_same_order_per_epoch(self):
+        position = DataPosition(seed=1)
+        shuffled = position.shuffled(self.events, buffer_size=100, batch_size=8)
+        first = batches(shuffled)
+        self.assertEqual(first, batches(shuffled)) # a new iterator of the same epoch
+        self.assertEqual(sorted(sum(first, [])), list(range(100)))
+
+        position.set(1)
+        second = batches(shuffled)
+        self.assertNotEqual(first, second)
+        self.assertEqual(sorted(sum(second, [])), list(range(100)))
+
+    def test_resume_mid_epoch(self):
+        position = DataPosition(seed=1)
+        shuffled = position.shuffled(self.events, buffer_size=100, batch_size=8)
+        position.set(3)
+        epoch = batches(shuffled)
+
+        # an interrupted training, resumed by another process with the same seed
+        resumed = DataPosition(seed=1)
+        resumed.set(3, 5)
+        self.assertEqual(batches(resumed.shuffled(self.events, buffer_size=100, batch_size=8)), epoch[5:])
+
+    def test_seed(self):
+        first = batches(DataPosition(seed=1).shuffled(self.events, buffer_size=100, batch_size=8))
+        second = batches(DataPosition(seed=2).shuffled(self.events, buffer_size=100, batch_size=8))
+        self.assertNotEqual(first, second)
+
+    def test_sampled(self):
+        streams = [tf.data.Dataset.range(k * 100, k * 100 + 10) for k in range(3)]
+
+        def sampled(position):
+            return batches(position.sampled(streams, [.5, .25, .25], buffer_size=10, batch_size=8), take=20)
+
+        position = DataPosition(seed=1)
+        position.set(2)
+        drawn = sampled(position)
+        resumed = DataPosition(seed=1)
+        resumed.set(2)
+        self.assertEqual(sampled(resumed), drawn)
+        resumed.set(3)
+        self.assertNotEqual(sampled(resumed), drawn)
+
+        classes = np.array(sum(drawn, [])) // 100
+        self.assertEqual(len(classes), 160)
+        self.assertGreater(np.mean(classes == 0), .35)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
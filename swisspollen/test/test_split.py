@@ -0,0 +1,113 @@
+
+import os
+import shutil
+import tempfile
+import unittest
+import uuid
+from unittest import mock
+
+import numpy as np
+import tensorflow as tf
+
+import swisspollen.split as split
+from swisspollen.split import SPLIT_BUCKETS, event_buckets, fold_events, get_bucket_counts, get_split_sizes, split_batches, split_events
+
+
+def event_ids(dataset: tf.data.Dataset) -> list:
+    return [ids['id'] for ids, features, targets in dataset.as_numpy_iterator()]
+
+
+class Test_Split(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.ids = [str(uuid.UUID(bytes=rng.bytes(16))).encode() for _ in range(2000)]
+        self.events = tf.data.Dataset.from_tensor_slices((
+            {'id': self.ids},
+            {'rec0': np.zeros((len(self.ids), 1), dtype=np.float32)},
+            np.zeros(len(self.ids), dtype=np.int64),
+        ))
+
+    def test_canonical_ids(self):
+        ids = [str(uuid.UUID(bytes=bytes(range(16))))]
+        variants = ids + [ids[0].upper(), ids[0].replace('-', ''), '{' + ids[0] + '}']
+        buckets = event_buckets(tf.constant(variants)).numpy()
+        self.assertEqual(len(set(buckets)), 1)
+
+    def test_split_disjoint(self):
+        train = event_ids(split_events(self.events, (.7, .3), 'train'))
+        val = event_ids(split_events(self.events, (.7, .3), 'val'))
+        self.assertEqual(len(set(train) & set(val)), 0)
+        self.assertEqual(sorted(train + val), sorted(self.ids))
+        self.assertAlmostEqual(len(train) / len(self.ids), .7, delta=.05)
+
+    def test_split_stable(self):
+        train = event_ids(split_events(self.events, (.7, .3), 'train'))
+        # same side whatever the order of the events and the other events
+        shuffled = self.events.shuffle(len(self.ids), seed=1, reshuffle_each_iteration=False).take(1000)
+        kept = set(event_ids(shuffled))
+        self.assertEqual(set(event_ids(split_events(shuffled, (.7, .3), 'train'))), kept & set(train))
+        # growing train_part only moves validation events to training
+        self.assertTrue(set(train) <= set(event_ids(split_events(self.events, (.8, .2), 'train'))))
+
+    def test_split_batches(self):
+        for side in ['train', 'val']:
+            batched = split_batches(self.events.batch(64), (.7, .3), side).unbatch()
+            self.assertEqual(event_ids(batched), event_ids(split_events(self.events, (.7, .3), side)))
+
+    def test_folds(self):
+        num_folds = 5
+        vals = [event_ids(fold_events(self.events, num_folds, k, 'val')) for k in range(num_folds)]
+        self.assertEqual(sorted(sum(vals, [])), sorted(self.ids)) # disjoint and covering all the events
+        for k in range(num_folds):
+            train = event_ids(fold_events(self.events, num_folds, k, 'train'))
+            self.assertEqual(len(set(train) & set(vals[k])), 0)
+            self.assertEqual(sorted(train + vals[k]), sorted(self.ids))
+        self.assertEqual(event_ids(fold_events(self.events, num_folds, 2, 'val')), vals[2])
+
+    def test_split_sizes(self):
+        buckets = event_buckets(tf.constant(self.ids)).numpy()
+        bucket_counts = {'a': np.bincount(buckets, minlength=SPLIT_BUCKETS)}
+        sizes = get_split_sizes(bucket_counts, (.7, .3))
+        self.assertEqual(sizes['train']['a'], len(event_ids(split_events(self.events, (.7, .3), 'train'))))
+        self.assertEqual(sizes['val']['a'], len(event_ids(split_events(self.events, (.7, .3), 'val'))))
+
+
+class Test_BucketCounts(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'bucket_counts.npz')
+        self.queried = []
+        self.sizes = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def query_bucket_counts(self, session, dataset_ids):
+        self.queried.append(sorted(dataset_ids))
+        return {k: np.bincount(np.arange(self.sizes[k]) % SPLIT_BUCKETS, minlength=SPLIT_BUCKETS) for k in dataset_ids}
+
+    def bucket_counts(self, sizes):
+        # the datasets of the database have `sizes` events
+        self.sizes = sizes
+        with mock.patch.object(split, 'query_bucket_counts', self.query_bucket_counts):
+            return get_bucket_counts(None, sizes, cache_file_path=self.path)
+
+    def test_cached(self):
+        counts = self.bucket_counts({'a': 3, 'b': 5})
+        self.assertEqual({k: int(c.sum()) for k, c in counts.items()}, {'a': 3, 'b': 5})
+        counts = self.bucket_counts({'a': 3, 'b': 5})
+        self.assertEqual({k: int(c.sum()) for k, c in counts.items()}, {'a': 3, 'b': 5})
+        self.assertEqual(self.queried, [['a', 'b']])
+
+    def test_recount_changed(self):
+        self.bucket_counts({'a': 3, 'b': 5})
+        counts = self.bucket_counts({'a': 4, 'b': 5, 'c': 1})
+        self.assertEqual({k: int(c.sum()) for k, c in counts.items()}, {'a': 4, 'b': 5, 'c': 1})
+        self.assertEqual(self.queried, [['a', 'b'], ['a', 'c']])
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,70 @@
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from swisspollen.sweep import DEFAULTS, load_config
+
+
+class Test_LoadConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.root, name)
+        with open(path, 'w') as f:
+            f.write(json.dumps(content))
+        return path
+
+    def test_runs(self):
+        path = self.write('lr.json', {
+            'base': {'batch_size': 16, 'model_name': 'real2', 'results': {}},
+            'runs': [{'learning_rate': 1e-4}, {'learning_rate': 1e-5, 'batch_size': 8}],
+        })
+        name, runs = load_config(path)
+
+        self.assertEqual(name, 'lr')
+        self.assertEqual([run['model_name'] for run in runs], ['lr_0', 'lr_1'])
+        self.assertEqual([run['batch_size'] for run in runs], [16, 8])
+        self.assertEqual([run['learning_rate'] for run in runs], [1e-4, 1e-5])
+        self.assertEqual(runs[0]['epochs'], DEFAULTS['epochs'])
+        self.assertNotIn('results', runs[0]) # only the parameters of the base are kept
+
+    def test_folds(self):
+        path = self.write('cv.json', {
+            'name': 'cv',
+            'runs': [{'num_folds': 3}, {'num_folds': 3, 'fold': 1}, {}],
+        })
+        _, runs = load_config(path)
+
+        self.assertEqual(
+            [(run['model_name'], run['fold']) for run in runs],
+            [('cv_0_fold0', 0), ('cv_0_fold1', 1), ('cv_0_fold2', 2), ('cv_1_fold1', 1), ('cv_2', None)]
+        )
+        self.assertTrue(all(run['num_folds'] == 3 for run in runs[:4]))
+
+    def test_architecture(self):
+        effnet = self.write('effnet_info.json', {'backbone': 'EfficientNetB1', 'fine_tune': False})
+        operational = self.write('operational_info.json', {'shared_tower': True, 'hidden_units': None})
+        recorded = self.write('recorded_info.json', {'architecture': 'operational', 'backbone': 'EfficientNetB0'})
+
+        runs = [load_config(self.write('s.json', {'base': base, 'runs': [{}]}))[1][0] for base in [effnet, operational, recorded]]
+
+        self.assertEqual([run['architecture'] for run in runs], ['effnet', 'operational', 'operational'])
+        self.assertEqual(runs[0]['backbone'], 'EfficientNetB1')
+        self.assertIsNone(runs[1]['hidden_units'])
+
+    def test_unknown_architecture(self):
+        path = self.write('s.json', {'runs': [{'architecture': 'resnet'}]})
+        self.assertRaises(AssertionError, load_config, path)
+
+
+# Standalone.
+if __name__ == '__main__':
+    unittest.main(verbosity=2)